@@ -1,150 +1,205 @@
 import asyncio
 import logging
-from datetime import datetime
-from decimal import Decimal
-
-from elasticsearch import Elasticsearch
-
-from model.f1_2020_struct import *
-
-
-class F1UdpReceiver(asyncio.DatagramProtocol):
-    def __init__(self):
-        super().__init__()
-        self.es = Elasticsearch("http://es01:9200")
-        self.participant_name = {}
-
-    def connection_made(self, transport):
-        self.transport = transport
-
-    def datagram_received(self, data, addr):
-        header = PacketHeader.from_buffer_copy(data[0:24])
-        if int(header.packetId) == 1:
-            packet = PacketSessionData_V1.from_buffer_copy(data[0:251])
-            data = {
-                "session_ts": header.sessionTime,
-                "@timestamp": datetime.utcnow().isoformat(),
-                "session_UUID": str(header.sessionUID),
-                "frame_id": header.frameIdentifier,
-                "track": TrackIDs[packet.trackId],
-                "type": SessionsType[packet.sessionType],
-                "weather": Weather[packet.weather],
-                "car_type": Formula[packet.formula],
-                "track_temp": packet.trackTemperature,
-                "air_temp": packet.airTemperature,
-                "total_laps": packet.totalLaps,
-                "track_length": packet.trackLength,
-            }
-            data["name"] = f"{data['track']} - {data['type']} - {data['weather']} - {datetime.utcnow().isoformat()}"
-            self.es.index(index="f1", body=data, request_timeout=30)
-
-        elif int(header.packetId) == 2:
-            packet = PacketLapData_V1.from_buffer_copy(data[0:1190])
-            data = {
-                "session_ts": header.sessionTime,
-                "@timestamp": datetime.utcnow().isoformat(),
-                "packet_id": header.packetId,
-                "session_UUID": str(header.sessionUID),
-                "session_time": header.sessionTime,
-                "frame_id": header.frameIdentifier,
-                "player_index": header.playerCarIndex,
-                "player_name": self.participant_name[header.playerCarIndex],
-                "lap_uuid": f"{header.sessionUID}-{header.playerCarIndex}-{header.frameIdentifier}",
-                "last_lap_time": Decimal(packet.lapData[header.playerCarIndex].lastLapTime),
-                "current_lap_time": Decimal(packet.lapData[header.playerCarIndex].currentLapTime),
-                "best_lap_time": Decimal(packet.lapData[header.playerCarIndex].bestLapTime),
-                "s1": Decimal(packet.lapData[header.playerCarIndex].sector1TimeInMS),
-                "s2": Decimal(packet.lapData[header.playerCarIndex].sector2TimeInMS),
-                "lap_distance": Decimal(packet.lapData[header.playerCarIndex].lapDistance),
-                "total_distance": Decimal(packet.lapData[header.playerCarIndex].totalDistance),
-                "car_position": packet.lapData[header.playerCarIndex].carPosition,
-                "current_lap_num": packet.lapData[header.playerCarIndex].currentLapNum,
-                "pit_status": packet.lapData[header.playerCarIndex].pitStatus,
-                "sector": packet.lapData[header.playerCarIndex].sector,
-                "lap_invalid": packet.lapData[header.playerCarIndex].currentLapInvalid,
-                "penalities": packet.lapData[header.playerCarIndex].penalties,
-                "grid_pos": packet.lapData[header.playerCarIndex].gridPosition,
-                "driver_status": packet.lapData[header.playerCarIndex].driverStatus,
-                "result_status": packet.lapData[header.playerCarIndex].resultStatus
-            }
-            self.es.index(index="f1", body=data, request_timeout=30)
-
-        elif int(header.packetId) == 4 and header.frameIdentifier == 0:
-            self.participant_name = {}
-            packet = PacketParticipantsData_V1.from_buffer_copy(data[0:1213])
-            for index, participant in enumerate(packet.participants):
-                self.participant_name[index] = participant.name.decode("utf-8")
-
-        elif int(header.packetId) == 6:
-            packet = PacketCarTelemetryData_V1.from_buffer_copy(data[0:1307])
-            data = {
-                "session_ts": header.sessionTime,
-                "@timestamp": datetime.utcnow().isoformat(),
-                "packet_id": header.packetId,
-                "session_UUID": str(header.sessionUID),
-                "session_time": header.sessionTime,
-                "frame_id": header.frameIdentifier,
-                "player_index": header.playerCarIndex,
-                "player_name": self.participant_name[header.playerCarIndex],
-                "speed": packet.carTelemetryData[header.playerCarIndex].speed,
-                "throttle": packet.carTelemetryData[header.playerCarIndex].throttle,
-                "steering": packet.carTelemetryData[header.playerCarIndex].steer,
-                "brake": packet.carTelemetryData[header.playerCarIndex].brake,
-                "clutch": packet.carTelemetryData[header.playerCarIndex].clutch,
-                "gear": packet.carTelemetryData[header.playerCarIndex].gear,
-                "engine_RPM": packet.carTelemetryData[header.playerCarIndex].engineRPM,
-                "DRS_enabled": packet.carTelemetryData[header.playerCarIndex].drs,
-                "dev_lights": packet.carTelemetryData[header.playerCarIndex].revLightsPercent,
-                "FL_brake_T": packet.carTelemetryData[header.playerCarIndex].brakesTemperature[0],
-                "FR_brake_T": packet.carTelemetryData[header.playerCarIndex].brakesTemperature[1],
-                "RL_brake_T": packet.carTelemetryData[header.playerCarIndex].brakesTemperature[2],
-                "RR_brake_T": packet.carTelemetryData[header.playerCarIndex].brakesTemperature[3],
-                "FL_tyre_surface_T": packet.carTelemetryData[header.playerCarIndex].tyresSurfaceTemperature[0],
-                "FR_tyre_surface_T": packet.carTelemetryData[header.playerCarIndex].tyresSurfaceTemperature[1],
-                "RL_tyre_surface_T": packet.carTelemetryData[header.playerCarIndex].tyresSurfaceTemperature[2],
-                "RR_tyre_surface_T": packet.carTelemetryData[header.playerCarIndex].tyresSurfaceTemperature[3],
-                "FL_tyre_inner_T": packet.carTelemetryData[header.playerCarIndex].tyresInnerTemperature[0],
-                "FR_tyre_inner_T": packet.carTelemetryData[header.playerCarIndex].tyresInnerTemperature[1],
-                "RL_tyre_inner_T": packet.carTelemetryData[header.playerCarIndex].tyresInnerTemperature[2],
-                "RR_tyre_inner_T": packet.carTelemetryData[header.playerCarIndex].tyresInnerTemperature[3],
-                "engine_T": packet.carTelemetryData[header.playerCarIndex].engineTemperature,
-                "FL_tyre_pressure": packet.carTelemetryData[header.playerCarIndex].tyresPressure[0],
-                "FR_tyre_pressure": packet.carTelemetryData[header.playerCarIndex].tyresPressure[1],
-                "RL_tyre_pressure": packet.carTelemetryData[header.playerCarIndex].tyresPressure[2],
-                "RR_tyre_pressure": packet.carTelemetryData[header.playerCarIndex].tyresPressure[3],
-                "FL_diving_surface": packet.carTelemetryData[header.playerCarIndex].surfaceType[0],
-                "FR_tyre_surface": packet.carTelemetryData[header.playerCarIndex].surfaceType[1],
-                "RL_tyre_surface": packet.carTelemetryData[header.playerCarIndex].surfaceType[2],
-                "RR_tyre_surface": packet.carTelemetryData[header.playerCarIndex].surfaceType[3]
-            }
-            self.es.index(index="f1", body=data, request_timeout=30)
-
-        elif int(header.packetId) == 8:
-            packet = PacketFinalClassificationData_V1.from_buffer_copy(data[0:839])
-            data = {
-                "session_ts": header.sessionTime,
-                "@timestamp": datetime.utcnow().isoformat(),
-                "packet_id": header.packetId,
-                "session_UUID": str(header.sessionUID),
-                "session_time": header.sessionTime,
-                "frame_id": header.frameIdentifier,
-                "player_index": header.playerCarIndex,
-                "player_name": self.participant_name[header.playerCarIndex],
-                "position": packet.classificationData[header.playerCarIndex].position,
-                "num_laps": packet.classificationData[header.playerCarIndex].numLaps,
-                "grid_position": packet.classificationData[header.playerCarIndex].gridPosition,
-                "points": packet.classificationData[header.playerCarIndex].points,
-                "num_pit_stops": packet.classificationData[header.playerCarIndex].numPitStops,
-                "result_status": packet.classificationData[header.playerCarIndex].resultStatus,
-                "best_lap_time": packet.classificationData[header.playerCarIndex].bestLapTime,
-                "total_race_time": packet.classificationData[header.playerCarIndex].totalRaceTime,
-                "penalties_time": packet.classificationData[header.playerCarIndex].penaltiesTime,
-                "num_penalties": packet.classificationData[header.playerCarIndex].numPenalties,
-                "num_tyre_stints": packet.classificationData[header.playerCarIndex].numTyreStints,
-                # "tyre_stints_actual": packet.classificationData[header.playerCarIndex].tyreStintsActual,
-                # "tyre_stints_visual": packet.classificationData[header.playerCarIndex].tyreStintsVisual,
-            }
-            self.es.index(index="f1", body=data, request_timeout=30)
+import multiprocessing
+import os
+import socket
+import time
+
+from buffers import BufferPool
+from capture import CaptureWriter
+from join import FrameJoiner
+from pipeline import Pipeline
+from processor import PacketProcessor
+from sink import BulkSink
+from templates import install_templates
+
+
+class F1UdpReceiver:
+    """Read datagrams straight into pooled buffers and hand them to the pipeline.
+
+    asyncio datagram protocols only deliver freshly allocated bytes, so the socket is read
+    with recv_into from an event loop reader callback instead.
+    """
+
+    def __init__(self, sock, pool, pipeline):
+        self.sock = sock
+        self.pool = pool
+        self.pipeline = pipeline
+
+    def read_ready(self):
+        while True:
+            buf = self.pool.acquire()
+            try:
+                size = self.sock.recv_into(buf)
+            except (BlockingIOError, InterruptedError):
+                self.pool.release(buf)
+                return
+            if not self.pipeline.put((buf, size, time.time())):
+                self.pool.release(buf)
+
+
+def pooled_handler(processor, pool, capture=None):
+    """Wrap `processor.process` to take (buffer, size, receive time) items.
+
+    Every datagram is appended to `capture` first, if given, and buffers are returned to the pool
+    once processed.
+    """
+
+    def handle(item):
+        buf, size, received_at = item
+        view = memoryview(buf)[:size]
+        try:
+            if capture is not None:
+                capture.write(view, received_at)
+            processor.process(view, received_at)
+        finally:
+            pool.release(buf)
+
+    return handle
+
+
+def report_stats(loop, interval, pipeline, sink, loss=None):
+    logging.info("Pipeline stats: %s", pipeline.stats())
+    logging.info("Sink stats: %s", sink.stats())
+    if loss is not None:
+        logging.info("Packet loss stats: %s", loss.stats())
+    loop.call_later(interval, report_stats, loop, interval, pipeline, sink, loss)
+
+
+def serve(worker=None, reuse_port=False):
+    """Run one ingester: UDP socket, pipeline and sink, until interrupted.
+
+    Args:
+        worker: index of this process under `supervise`, used to keep capture files apart.
+        reuse_port: bind with SO_REUSEPORT so several processes can share the port.
+    """
+    # Elasticsearch sink
+    sink = BulkSink(
+        hosts=os.environ.get("F1_ES_HOSTS", "http://es01:9200").split(","),
+        batch_size=int(os.environ.get("F1_BULK_SIZE", 500)),
+        flush_interval=float(os.environ.get("F1_BULK_FLUSH_INTERVAL", 1.0)),
+        max_in_flight=int(os.environ.get("F1_BULK_MAX_IN_FLIGHT", 2)),
+        compress=os.environ.get("F1_BULK_COMPRESS", "0") == "1",
+        priority_flush_interval=float(os.environ.get("F1_PRIORITY_FLUSH_INTERVAL", 0.05)),
+        sniff=os.environ.get("F1_ES_SNIFF", "0") == "1",
+        sniff_interval=float(os.environ.get("F1_ES_SNIFF_INTERVAL", 60)),
+        connections_per_host=int(os.environ.get("F1_ES_CONNECTIONS_PER_HOST", 0)) or None,
+        dead_timeout=float(os.environ.get("F1_ES_DEAD_TIMEOUT", 60)),
+        health_interval=float(os.environ.get("F1_ES_HEALTH_INTERVAL", 10)),
+    )
+    if os.environ.get("F1_TEMPLATES", "1") == "1":
+        install_templates(
+            sink.es,
+            shards=int(os.environ.get("F1_INDEX_SHARDS", 1)),
+            replicas=int(os.environ.get("F1_INDEX_REPLICAS", 1)),
+        )
+    if os.environ.get("F1_JOIN", "0") == "1":
+        sink = FrameJoiner(sink, timeout=float(os.environ.get("F1_JOIN_TIMEOUT", 0.05)))
+
+    # Decoding happens on worker threads so the event loop only reads the socket
+    queue_size = int(os.environ.get("F1_QUEUE_SIZE", 10000))
+    workers = int(os.environ.get("F1_WORKERS", 1))
+    pool = BufferPool(queue_size + workers + 1)
+    processor = PacketProcessor(
+        sink,
+        all_cars=os.environ.get("F1_ALL_CARS") or None,
+        rollup=os.environ.get("F1_ROLLUP", "0") == "1",
+        raw=os.environ.get("F1_RAW", "1") == "1",
+        delta=os.environ.get("F1_DELTA", "0") == "1",
+        keyframe_interval=float(os.environ.get("F1_DELTA_KEYFRAME_INTERVAL", 1.0)),
+        timestamp_format=os.environ.get("F1_TIMESTAMP_FORMAT", "iso"),
+        motion=os.environ.get("F1_MOTION", "0") == "1",
+        motion_window=float(os.environ.get("F1_MOTION_WINDOW", 300)),
+        motion_rate=float(os.environ.get("F1_MOTION_RATE", 1.0)),
+        status=os.environ.get("F1_STATUS", "0") == "1",
+        status_interval=float(os.environ.get("F1_STATUS_INTERVAL", 5.0)),
+        setups=os.environ.get("F1_SETUPS", "0") == "1",
+        loss=os.environ.get("F1_LOSS", "0") == "1",
+        drop_duplicates=os.environ.get("F1_DROP_DUPLICATES", "0") == "1",
+        packets=os.environ["F1_PACKETS"].split(",") if os.environ.get("F1_PACKETS") else None,
+    )
+    capture = None
+    if "F1_CAPTURE_DIR" in os.environ:
+        directory = os.environ["F1_CAPTURE_DIR"]
+        if worker is not None:
+            directory = os.path.join(directory, f"worker-{worker}")
+        capture = CaptureWriter(
+            directory,
+            segment_size=int(os.environ.get("F1_CAPTURE_SEGMENT_MB", 256)) * 1024 * 1024,
+        )
+    pipeline = Pipeline(pooled_handler(processor, pool, capture), queue_size=queue_size, workers=workers)
+    pipeline.start()
+
+    # UDP socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if "F1_RCVBUF" in os.environ:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(os.environ["F1_RCVBUF"]))
+    sock.setblocking(False)
+    sock.bind(('0.0.0.0', 20777))
+
+    # Server loop
+    loop = asyncio.new_event_loop()
+    receiver = F1UdpReceiver(sock, pool, pipeline)
+    loop.add_reader(sock, receiver.read_ready)
+    stats_interval = float(os.environ.get("F1_STATS_INTERVAL", 30))
+    loop.call_later(stats_interval, report_stats, loop, stats_interval, pipeline, sink, processor.loss)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.remove_reader(sock)
+        pipeline.close()
+        if capture is not None:
+            capture.close()
+        sink.close()
+        sock.close()
+        logging.info("Pipeline stats: %s", pipeline.stats())
+        logging.info("Sink stats: %s", sink.stats())
+        if processor.loss is not None:
+            logging.info("Packet loss stats: %s", processor.loss.stats())
+
+
+def supervise(processes):
+    """Run `processes` ingesters sharing the UDP port, restarting any that die.
+
+    The kernel spreads SO_REUSEPORT traffic by hashing the source and destination addresses, so
+    all packets from one game (and therefore every packet of its sessions) reach the same
+    process, and per-session state such as participant names stays with that process. Several
+    rigs are spread over the processes.
+
+    This only holds while the group of sockets is unchanged. When a child is restarted its new
+    socket joins the group, and the kernel may then send a rig's packets to another process.
+    That process starts the session from scratch: car names are missing until the next
+    participants packet (sent every five seconds), and lap, stint and setup tracking, rollups
+    and loss counters start again from there.
+    """
+    children = {}
+
+    def start(worker):
+        process = multiprocessing.Process(
+            target=serve, kwargs={"worker": worker, "reuse_port": True}, name=f"ingester-{worker}"
+        )
+        process.start()
+        children[worker] = process
+
+    for worker in range(processes):
+        start(worker)
+    try:
+        while True:
+            time.sleep(1)
+            for worker, process in list(children.items()):
+                if not process.is_alive():
+                    logging.warning("Ingester %d exited with code %s, restarting", worker, process.exitcode)
+                    start(worker)
+    except KeyboardInterrupt:
+        # Children receive the same SIGINT from the terminal and shut down on their own
+        for process in children.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
 
 
 if __name__ == "__main__":
@@ -152,9 +207,11 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     logging.info("Server started on 20777")
 
-    # Server loop
-    loop = asyncio.get_event_loop()
-    t = loop.create_datagram_endpoint(F1UdpReceiver, local_addr=('0.0.0.0', 20777))
-    loop.run_until_complete(t)
-    loop.run_forever()
-
+    processes = int(os.environ.get("F1_PROCESSES", 1))
+    if processes > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logging.warning("SO_REUSEPORT is not available on this platform, ignoring F1_PROCESSES=%d", processes)
+        processes = 1
+    if processes > 1:
+        supervise(processes)
+    else:
+        serve()
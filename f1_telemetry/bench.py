@@ -0,0 +1,205 @@
+"""
+Micro-benchmarks for the packet decoding and document building path
+
+Every case runs against packets from the synthetic generator, so no game is needed.
+
+Usage:
+
+    python bench.py [--filter SUBSTRING] [--json results.json]
+
+The JSON output maps each case name to its µs/packet and packets/s, plus some metadata, so
+results from different commits can be compared to track regressions.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+
+from elasticsearch.client.utils import _bulk_body
+from elasticsearch.serializer import JSONSerializer
+
+from generator import PacketGenerator
+from model.extractors import Extractor, FullMappings, ctypes_extract
+from model.f1_2020_struct import *
+from model.views import read_header, view_packet
+from processor import PacketProcessor
+from serializer import NdjsonSerializer
+from sink import NullSink
+
+# Documents per bulk body in the bulk_body cases
+BULK_BATCH = 500
+
+# Packet types PacketProcessor builds documents for
+HANDLED_PACKETS = [
+    PacketID.SESSION,
+    PacketID.LAP_DATA,
+    PacketID.CAR_TELEMETRY,
+    PacketID.FINAL_CLASSIFICATION,
+]
+
+
+class CollectingSink:
+    """Sink keeping the last document per packet id, to benchmark serialization."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def add(self, index, doc):
+        self.docs[doc.get("packet_id", PacketID.SESSION)] = doc
+
+    add_priority = add
+
+
+def make_processor(generator, all_cars=None, sink=None, **options):
+    """Return a PacketProcessor that has already seen the generator's participants packet."""
+    processor = PacketProcessor(sink or NullSink(), all_cars=all_cars, **options)
+    processor.process(generator.packet(PacketID.PARTICIPANTS))
+    return processor
+
+
+def make_packets(generator):
+    """Advance the generator a few seconds and return one packet of every type."""
+    for _ in range(300):
+        generator.advance()
+    return {packet_id: generator.packet(packet_id) for packet_id in PacketID}
+
+
+def bench(fn, number=2000, repeat=5):
+    """Return the best time per call in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def header_fields(header):
+    return (
+        (header.packetFormat, header.packetVersion, header.packetId),
+        header.sessionUID,
+        header.sessionTime,
+        header.frameIdentifier,
+        header.playerCarIndex,
+    )
+
+
+def client_bulk_body(serializer, batch):
+    """Build a bulk body the way the elasticsearch client does when given a list of actions."""
+    body = []
+    for index, doc in batch:
+        body.append({"create": {"_index": index}})
+        body.append(doc)
+    return _bulk_body(serializer, body).encode("utf-8")
+
+
+def cases():
+    """Yield (name, callable) or (name, callable, items per call) for every benchmark case."""
+    generator = PacketGenerator()
+    packets = make_packets(generator)
+    telemetry = packets[PacketID.CAR_TELEMETRY]
+
+    yield "header/from_buffer", lambda: PacketHeader.from_buffer(telemetry)
+    yield "header/from_buffer_copy", lambda: PacketHeader.from_buffer_copy(telemetry[0:24])
+    yield "header/read_header", lambda: read_header(telemetry)
+    # Routing key plus the fields PacketProcessor reads on every packet
+    yield "header_fields/from_buffer_copy", lambda: header_fields(PacketHeader.from_buffer_copy(telemetry[0:24]))
+    yield "header_fields/read_header", lambda: header_fields(read_header(telemetry))
+
+    for packet_id, data in packets.items():
+        raw = bytes(data)
+        yield f"unpack_udp_packet/{packet_id.name.lower()}", lambda raw=raw: unpack_udp_packet(raw).header.frameIdentifier
+        yield f"view_packet/{packet_id.name.lower()}", lambda raw=raw: view_packet(raw).header.frameIdentifier
+
+    for packet_id, data in packets.items():
+        packet_type = HeaderFieldsToPacketType[(2020, 1, int(packet_id))]
+        mapping = FullMappings[packet_type]
+        extractor = Extractor(packet_type, mapping)
+        name = f"extract/{packet_id.name.lower()}"
+        yield f"{name}/ctypes", lambda packet_type=packet_type, data=data, mapping=mapping: ctypes_extract(
+            packet_type.from_buffer(data), mapping
+        )
+        yield f"{name}/compiled", lambda extractor=extractor, data=data: extractor(data)
+
+    for packet_id in HANDLED_PACKETS:
+        data = packets[packet_id]
+        for mode in (None, "car", "frame"):
+            if mode and packet_id == PacketID.SESSION:
+                continue
+            processor = make_processor(generator, mode)
+            name = f"handler/{packet_id.name.lower()}/{mode or 'player'}"
+            yield name, lambda processor=processor, data=data: processor.process(data)
+        if packet_id in (PacketID.LAP_DATA, PacketID.CAR_TELEMETRY):
+            processor = make_processor(generator, rollup=True, raw=False)
+            name = f"handler/{packet_id.name.lower()}/rollup"
+            yield name, lambda processor=processor, data=data: processor.process(data)
+
+    processor = make_processor(generator, motion=True)
+    data = packets[PacketID.MOTION]
+    yield "handler/motion/ring", lambda: processor.process(data)
+
+    processor = make_processor(generator, status=True)
+    data = packets[PacketID.CAR_STATUS]
+    yield "handler/car_status/tracker", lambda: processor.process(data)
+
+    processor = make_processor(generator, setups=True)
+    data = packets[PacketID.CAR_SETUPS]
+    processor.process(data)
+    yield "handler/car_setups/unchanged", lambda: processor.process(data)
+
+    processor = make_processor(generator)
+    data = packets[PacketID.EVENT]
+    yield "handler/event/publisher", lambda: processor.process(data)
+
+    processor = make_processor(generator, packets=["session", "lap_data"])
+    data = packets[PacketID.CAR_TELEMETRY]
+    yield "handler/car_telemetry/disabled", lambda: processor.process(data)
+
+    collector = CollectingSink()
+    processor = make_processor(generator, sink=collector)
+    for packet_id in HANDLED_PACKETS:
+        processor.process(packets[packet_id])
+    serializer = JSONSerializer()
+    ndjson = NdjsonSerializer()
+    for packet_id, doc in collector.docs.items():
+        name = PacketID(packet_id).name.lower()
+        yield f"serialize/{name}", lambda doc=doc: serializer.dumps(doc)
+        batch = [("f1", doc)] * BULK_BATCH
+        yield f"bulk_body/{name}/client", lambda batch=batch: client_bulk_body(serializer, batch), BULK_BATCH
+        yield f"bulk_body/{name}/ndjson", lambda batch=batch: ndjson.bulk_body(batch), BULK_BATCH
+
+
+def run(name_filter=None, number=2000):
+    results = {}
+    for name, fn, *items in cases():
+        if name_filter and name_filter not in name:
+            continue
+        per_call = items[0] if items else 1
+        us = bench(fn, number=max(number // per_call, 1)) / per_call
+        results[name] = {"us_per_packet": round(us, 3), "packets_per_sec": round(1e6 / us)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark packet decoding and document building")
+    parser.add_argument("--filter", help="only run cases whose name contains this string")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    parser.add_argument("--json", help="write machine-readable results to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.number)
+
+    if args.json:
+        output = {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }
+        if args.json == "-":
+            json.dump(output, sys.stdout, indent=2)
+        else:
+            with open(args.json, "w") as f:
+                json.dump(output, f, indent=2)
+    else:
+        for name, result in results.items():
+            print(f"{name:45s} {result['us_per_packet']:10.2f} us/packet {result['packets_per_sec']:10d} packets/s")
@@ -0,0 +1,35 @@
+"""
+Pool of preallocated receive buffers
+"""
+import collections
+
+# Larger than the biggest F1 2020 packet (motion, 1464 bytes)
+BUFFER_SIZE = 2048
+
+
+class BufferPool:
+    """Reusable bytearrays for receiving datagrams without per-packet allocation.
+
+    Packets are read in place from the buffers, so a buffer must not be released until every
+    packet view or array built on it has been dropped. When the pool runs dry a fresh
+    buffer is allocated and counted in `allocated`; it joins the pool once released.
+    """
+
+    def __init__(self, count, size=BUFFER_SIZE):
+        self.size = size
+        self.allocated = 0
+        # deque.append and deque.pop are atomic, so the pool is shared between threads without a lock
+        self._free = collections.deque(bytearray(size) for _ in range(count))
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            self.allocated += 1
+            return bytearray(self.size)
+
+    def release(self, buf):
+        self._free.append(buf)
+
+    def __len__(self):
+        return len(self._free)
@@ -0,0 +1,87 @@
+"""
+Append-only capture of raw telemetry datagrams
+
+A capture is a directory of numbered segments. Each segment is a pair of files:
+
+    capture-000001.bin  records of RECORD_HEADER (receive time, datagram length) + datagram bytes
+    capture-000001.idx  one INDEX_ENTRY (sessionUID, packetId, frameIdentifier, offset) per record
+
+The offset in an index entry is the position of the record header in the .bin file. Segments are
+rolled once they reach `segment_size` bytes, so a finished segment never changes again.
+"""
+import os
+import struct
+import threading
+
+# Receive time as seconds since the epoch, datagram length
+RECORD_HEADER = struct.Struct("<dI")
+
+# sessionUID, packetId, frameIdentifier, offset of the record in the segment
+INDEX_ENTRY = struct.Struct("<QBIQ")
+
+# The subset of PacketHeader needed for the index: packetId at byte 5, sessionUID at 6 and
+# frameIdentifier at 18
+PACKET_KEY = struct.Struct("<5xBQ4xI")
+
+SEGMENT_PATTERN = "capture-{:06d}"
+
+
+class CaptureWriter:
+    """Append raw datagrams to segmented capture files.
+
+    Writes go through large userspace buffers and are never fsynced per packet; data reaches the
+    disk when a buffer fills, when a segment is rolled and on `flush` or `close`.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, buffer_size=1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.records = 0
+
+        self._lock = threading.Lock()
+        self._segment = 0
+        self._data = None
+        self._index = None
+        self._offset = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = [name for name in os.listdir(directory) if name.startswith("capture-") and name.endswith(".bin")]
+        self._segment = max((int(name[8:14]) for name in existing), default=0)
+        self._roll()
+
+    def write(self, datagram, received_at):
+        """Append one datagram, received at `received_at` (seconds since the epoch)."""
+        size = len(datagram)
+        with self._lock:
+            if self._offset + RECORD_HEADER.size + size > self.segment_size and self._offset:
+                self._roll()
+            if size >= PACKET_KEY.size:
+                packet_id, session_uid, frame = PACKET_KEY.unpack_from(datagram)
+                self._index.write(INDEX_ENTRY.pack(session_uid, packet_id, frame, self._offset))
+            self._data.write(RECORD_HEADER.pack(received_at, size))
+            self._data.write(datagram)
+            self._offset += RECORD_HEADER.size + size
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+
+    def _roll(self):
+        self._close_segment()
+        self._segment += 1
+        base = os.path.join(self.directory, SEGMENT_PATTERN.format(self._segment))
+        self._data = open(base + ".bin", "wb", buffering=self.buffer_size)
+        self._index = open(base + ".idx", "wb", buffering=self.buffer_size // 16)
+        self._offset = 0
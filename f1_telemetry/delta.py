@@ -0,0 +1,91 @@
+"""
+Change-only emission of slowly varying telemetry channels
+
+Many telemetry fields (tyre pressures, engine and tyre temperatures, surface types) stay the
+same for seconds at a time. DeltaEncoder drops every field that has not moved by more than its
+deadband since it was last written, and drops the document entirely when nothing moved.
+
+Every `keyframe_interval` seconds of session time a complete document is written, marked with
+`"keyframe": true`. The full time series is rebuilt by carrying each field forward from the
+last document (keyframe or delta) of the same car that contains it.
+"""
+import fnmatch
+
+# Deadbands by field name pattern; fields that match no pattern are written on any change
+DEFAULT_DEADBANDS = {
+    "throttle": 0.01,
+    "steering": 0.01,
+    "brake": 0.01,
+    "*_tyre_pressure": 0.05,
+    "*_brake_T": 2,
+    "*_tyre_surface_T": 1,
+    "*_tyre_inner_T": 1,
+    "engine_T": 1,
+}
+
+# Cars tracked at once (22 cars for up to 16 sessions) before the oldest are forgotten
+MAX_KEYS = 22 * 16
+
+
+class DeltaEncoder:
+    """Strip unchanged fields from a stream of documents.
+
+    Args:
+        fields: document keys subject to delta encoding; all other keys are always kept.
+        deadbands: deadband by field name pattern (fnmatch syntax), DEFAULT_DEADBANDS if None.
+        keyframe_interval: seconds of session time between complete documents.
+    """
+
+    def __init__(self, fields, deadbands=None, keyframe_interval=1.0):
+        if deadbands is None:
+            deadbands = DEFAULT_DEADBANDS
+        self.keyframe_interval = keyframe_interval
+        self.fields = [(field, self._deadband(field, deadbands)) for field in fields]
+        self.keyframes = 0
+        self.deltas = 0
+        self.dropped = 0
+        self._last = {}
+
+    @staticmethod
+    def _deadband(field, deadbands):
+        for pattern, deadband in deadbands.items():
+            if fnmatch.fnmatchcase(field, pattern):
+                return deadband
+        return 0
+
+    def encode(self, key, doc, session_time):
+        """Return `doc` reduced to its changed fields, or None if nothing changed.
+
+        Args:
+            key: identifies the series, e.g. (sessionUID, car index).
+            doc: the complete document; modified in place.
+            session_time: the packet's sessionTime, used to schedule keyframes.
+        """
+        state = self._last.get(key)
+        if state is None or not 0 <= session_time - state[0] < self.keyframe_interval:
+            if state is None and len(self._last) >= MAX_KEYS:
+                del self._last[next(iter(self._last))]
+            self._last[key] = (session_time, {field: doc[field] for field, _ in self.fields})
+            doc["keyframe"] = True
+            self.keyframes += 1
+            return doc
+
+        last = state[1]
+        changed = False
+        for field, deadband in self.fields:
+            value = doc[field]
+            if abs(value - last[field]) > deadband:
+                last[field] = value
+                changed = True
+            else:
+                del doc[field]
+
+        if not changed:
+            self.dropped += 1
+            return None
+        doc["keyframe"] = False
+        self.deltas += 1
+        return doc
+
+    def stats(self):
+        return {"keyframes": self.keyframes, "deltas": self.deltas, "dropped": self.dropped}
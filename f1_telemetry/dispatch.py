@@ -0,0 +1,75 @@
+"""
+Table-driven routing of packets and events to their handlers
+
+A HandlerRegistry maps the (packetFormat, packetVersion, packetId) keys of HeaderFieldsToPacketType
+to handlers, and event string codes (packet 3) to event handlers. Routing a packet is a single
+dict lookup on its header, and a packet type without a handler costs nothing beyond reading the
+header. Handlers are registered by packet type, so a registry can be extended without touching
+the code that routes packets:
+
+    processor.handlers.register(PacketCarSetupData_V1, handle_setups)
+    processor.handlers.register_event(EventStringCode.PENA, handle_penalty)
+"""
+from model.f1_2020_struct import EventStringCode, PacketID, PacketTypeToHeaderFields
+
+
+def packet_ids(names):
+    """Parse packet names such as "lap_data" or "CAR_TELEMETRY" into a set of PacketID.
+
+    Raises:
+        ValueError for an unknown name.
+    """
+    result = set()
+    for name in names:
+        try:
+            result.add(PacketID[name.strip().upper()])
+        except KeyError:
+            raise ValueError(f"Unknown packet type {name!r}") from None
+    return result
+
+
+class HandlerRegistry:
+    """Handlers by packet key and by event code.
+
+    Packet handlers are called as handler(header, session, data) and event handlers as
+    handler(header, session, data, event), the event being an EventStringCode.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._event_handlers = {}
+
+    def register(self, packet_type, handler):
+        """Route packets of `packet_type` (e.g. PacketLapData_V1) to `handler`, replacing any other."""
+        self._handlers[PacketTypeToHeaderFields[packet_type]] = handler
+
+    def unregister(self, packet_type):
+        self._handlers.pop(PacketTypeToHeaderFields[packet_type], None)
+
+    def get(self, header):
+        """Return the handler for a packet header, or None."""
+        return self._handlers.get((header.packetFormat, header.packetVersion, header.packetId))
+
+    def restrict(self, packet_ids):
+        """Drop the handlers of every packet id not in `packet_ids`."""
+        for key in list(self._handlers):
+            if key[2] not in packet_ids:
+                del self._handlers[key]
+
+    def register_event(self, event, handler):
+        """Route events with code `event` (an EventStringCode) to `handler`, replacing any other."""
+        self._event_handlers[event.value] = handler
+
+    def unregister_event(self, event):
+        self._event_handlers.pop(event.value, None)
+
+    def get_event(self, code):
+        """Return the handler and EventStringCode for a raw 4-byte event code, or (None, None)."""
+        handler = self._event_handlers.get(code)
+        if handler is None:
+            return None, None
+        return handler, EventStringCode(code)
+
+    def packet_ids(self):
+        """Return the ids of the packets with a handler."""
+        return sorted(PacketID(key[2]) for key in self._handlers)
@@ -0,0 +1,110 @@
+"""
+Event packets (3): penalties, retirements, fastest laps and other race control events
+
+Events are rare but time-critical. EventPublisher decodes the EventDataDetails union member
+matching the event code, passes the document to the subscribers registered for that event right
+away, in the thread processing packets, and writes it through the sink's priority lane
+(BulkSink.add_priority), which sends it on its own instead of behind a batch of telemetry.
+
+    processor.events.subscribe(on_penalty, [EventStringCode.PENA])
+"""
+import logging
+
+from indices import EVENT_INDEX
+from model.extractors import Extractor
+from model.f1_2020_struct import EventStringCode, PacketEventData_V1
+from model.types import InfringementTypes, PenaltyTypes
+
+# Fields of the event documents by event code: (document key, field path[, converter]), see
+# model.extractors. Events missing here carry no details.
+EVENT_MAPPINGS = {
+    EventStringCode.FTLP: [
+        ("car_index", "eventDetails.fastestLap.vehicleIdx"),
+        ("lap_time", "eventDetails.fastestLap.lapTime"),
+    ],
+    EventStringCode.RTMT: [("car_index", "eventDetails.retirement.vehicleIdx")],
+    EventStringCode.TMPT: [("car_index", "eventDetails.teamMateInPits.vehicleIdx")],
+    EventStringCode.RCWN: [("car_index", "eventDetails.raceWinner.vehicleIdx")],
+    EventStringCode.PENA: [
+        ("penalty_type", "eventDetails.penalty.penaltyType", lambda value: PenaltyTypes.get(value, "unknown")),
+        ("infringement_type", "eventDetails.penalty.infringementType", lambda value: InfringementTypes.get(value, "unknown")),
+        ("car_index", "eventDetails.penalty.vehicleIdx"),
+        ("other_car_index", "eventDetails.penalty.otherVehicleIdx"),
+        ("time", "eventDetails.penalty.time"),
+        ("lap_num", "eventDetails.penalty.lapNum"),
+        ("places_gained", "eventDetails.penalty.placesGained"),
+    ],
+    EventStringCode.SPTP: [
+        ("car_index", "eventDetails.speedTrap.vehicleIdx"),
+        ("speed", "eventDetails.speedTrap.speed"),
+    ],
+}
+
+EVENT_EXTRACTORS = {event: Extractor(PacketEventData_V1, mapping) for event, mapping in EVENT_MAPPINGS.items()}
+
+# Car index fields of the details, and the name field added for each
+CAR_FIELDS = [("car_index", "car_name"), ("other_car_index", "other_car_name")]
+
+
+class EventPublisher:
+    """Turn event packets into documents for the sink and for subscribers.
+
+    Subscriber errors are logged and counted, and never stop the packet processing.
+
+    Args:
+        sink: where event documents are written, through its `add_priority` method.
+        session_states: the SessionCache providing participant names and timestamps.
+    """
+
+    def __init__(self, sink, session_states):
+        self.sink = sink
+        self.session_states = session_states
+        self.subscribers = {event: [] for event in EventStringCode}
+        self.published = 0
+        self.subscriber_errors = 0
+
+    def subscribe(self, callback, events=None):
+        """Call `callback(doc)` for every event whose EventStringCode is in `events` (all if None).
+
+        Callbacks run in the packet processing thread before the document is queued: they must
+        return quickly, and must not modify the document.
+        """
+        for event in events or EventStringCode:
+            self.subscribers[event].append(callback)
+
+    def unsubscribe(self, callback):
+        for callbacks in self.subscribers.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def handle(self, header, session, data, event):
+        """Packet processor event handler, see dispatch.HandlerRegistry.register_event."""
+        doc = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+            "event": event.name,
+            "event_name": EventStringCode.short_description[event],
+        }
+        extractor = EVENT_EXTRACTORS.get(event)
+        if extractor is not None:
+            doc.update(extractor(data))
+            for index_key, name_key in CAR_FIELDS:
+                index = doc.get(index_key)
+                if index is not None:
+                    doc[name_key] = session.car_name(index) if index < len(session.participants) else None
+
+        for callback in self.subscribers[event]:
+            try:
+                callback(doc)
+            except Exception:
+                logging.exception("Event subscriber %r failed", callback)
+                self.subscriber_errors += 1
+        self.sink.add_priority(EVENT_INDEX, doc)
+        self.published += 1
+
+    def stats(self):
+        return {"published": self.published, "subscriber_errors": self.subscriber_errors}
@@ -0,0 +1,367 @@
+"""
+Synthetic F1 2020 telemetry traffic
+
+PacketGenerator simulates a field of cars lapping a track and builds valid packets of all ten
+types from the structures in model.f1_2020_struct, so the ingester can be exercised and
+benchmarked without the game. Lap distance, speed, temperatures, fuel and tyre wear evolve from
+frame to frame; nothing is physically accurate beyond looking plausible on a dashboard.
+
+Usage (sends a 60 Hz stream to a running ingester):
+
+    python generator.py [--host 127.0.0.1] [--port 20777] [--rate 60] [--seconds 60]
+"""
+import argparse
+import math
+import random
+import socket
+import time
+
+from model.f1_2020_struct import *
+from model.types import DriverIDs, TeamIDs
+
+EVENT_CODES = [code for code in EventStringCode]
+
+
+class CarState:
+    """Simulated state of one car."""
+
+    def __init__(self, index, rng, track_length):
+        self.index = index
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.pace = rng.uniform(0.95, 1.05)
+        self.lap_distance = -index * 8.0  # staggered grid
+        self.total_distance = self.lap_distance
+        self.lap_num = 1
+        self.lap_start = 0.0
+        self.last_lap_time = 0.0
+        self.best_lap_time = 0.0
+        self.sector_times = [0, 0]
+        self.speed = 0.0
+        self.previous_speed = 0.0
+        self.brake_temperature = [300.0] * 4
+        self.tyre_surface_temperature = [80.0] * 4
+        self.tyre_inner_temperature = [90.0] * 4
+        self.engine_temperature = 90.0
+        self.fuel = 100.0
+        self.ers = 4000000.0
+        self.tyre_wear = [0.0] * 4
+        self.track_length = track_length
+
+    def advance(self, session_time, dt):
+        position = self.lap_distance / self.track_length
+        # Three corners per lap: sharp dips in the target speed create braking zones
+        target = self.pace * (90 + 220 * abs(math.sin(math.pi * 3 * position + self.phase)) ** 0.5)
+        self.previous_speed = self.speed
+        self.speed += max(-600 * dt, min(200 * dt, target - self.speed))
+        self.speed = max(self.speed, 0.0)
+
+        distance = self.speed / 3.6 * dt
+        self.lap_distance += distance
+        self.total_distance += distance
+        sector_length = self.track_length / 3
+        if self.lap_distance >= sector_length and not self.sector_times[0]:
+            self.sector_times[0] = int((session_time - self.lap_start) * 1000)
+        if self.lap_distance >= 2 * sector_length and not self.sector_times[1]:
+            self.sector_times[1] = int((session_time - self.lap_start) * 1000) - self.sector_times[0]
+        if self.lap_distance >= self.track_length:
+            self.lap_distance -= self.track_length
+            self.last_lap_time = session_time - self.lap_start
+            if not self.best_lap_time or self.last_lap_time < self.best_lap_time:
+                self.best_lap_time = self.last_lap_time
+            self.lap_start = session_time
+            self.lap_num += 1
+            self.sector_times = [0, 0]
+
+        braking = self.brake
+        for wheel in range(4):
+            self.brake_temperature[wheel] += (900 * braking - 0.5 * (self.brake_temperature[wheel] - 300)) * dt
+            self.tyre_surface_temperature[wheel] += (0.02 * (self.speed - 150) - 0.1 * (self.tyre_surface_temperature[wheel] - 85)) * dt
+            self.tyre_inner_temperature[wheel] += 0.05 * (self.tyre_surface_temperature[wheel] + 10 - self.tyre_inner_temperature[wheel]) * dt
+            self.tyre_wear[wheel] = min(100.0, self.tyre_wear[wheel] + distance * 0.0004)
+        self.engine_temperature += 0.05 * (90 + self.throttle * 20 - self.engine_temperature) * dt
+        self.fuel = max(0.0, self.fuel - distance * 0.00035)
+        self.ers = max(0.0, min(4000000.0, self.ers + (50000 * braking - 30000 * self.throttle) * dt))
+
+    @property
+    def throttle(self):
+        return 1.0 if self.speed >= self.previous_speed else 0.0
+
+    @property
+    def brake(self):
+        return min(1.0, max(0.0, (self.previous_speed - self.speed) / 10))
+
+    @property
+    def gear(self):
+        return max(1, min(8, int(self.speed / 40) + 1))
+
+    @property
+    def sector(self):
+        return min(2, max(0, int(3 * self.lap_distance / self.track_length)))
+
+
+class PacketGenerator:
+    """Build a plausible packet stream for a simulated session.
+
+    Call `frames()` to iterate over the datagrams sent each frame, at the rates the game uses:
+    motion, lap data, telemetry and status every frame, session and setups twice a second,
+    participants every five seconds and an event roughly every ten seconds.
+    """
+
+    def __init__(self, num_cars=22, rate=60, track_length=5303, session_uid=None, seed=0):
+        self.rng = random.Random(seed)
+        self.num_cars = num_cars
+        self.rate = rate
+        self.track_length = track_length
+        self.session_uid = session_uid if session_uid is not None else self.rng.getrandbits(64)
+        self.frame_identifier = 0
+        self.session_time = 0.0
+        self.driver_ids = self.rng.sample(sorted(DriverIDs), 22)
+        self.team_ids = [team for team in sorted(TeamIDs)[:10] for _ in range(2)] + [41, 41]
+        self.cars = [CarState(index, self.rng, track_length) for index in range(22)]
+
+    def advance(self):
+        """Move the simulation forward by one frame."""
+        dt = 1.0 / self.rate
+        self.session_time += dt
+        self.frame_identifier += 1
+        for car in self.cars:
+            car.advance(self.session_time, dt)
+
+    def frames(self, count):
+        """Yield the list of datagrams for each of `count` frames, advancing after each one."""
+        per_second = self.rate
+        for _ in range(count):
+            frame = self.frame_identifier
+            packets = []
+            if frame % (5 * per_second) == 0:
+                packets.append(PacketID.PARTICIPANTS)
+            if frame % max(1, per_second // 2) == 0:
+                packets += [PacketID.SESSION, PacketID.CAR_SETUPS]
+            if frame % (10 * per_second) == per_second:
+                packets.append(PacketID.EVENT)
+            packets += [PacketID.MOTION, PacketID.LAP_DATA, PacketID.CAR_TELEMETRY, PacketID.CAR_STATUS]
+            yield [self.packet(packet_id) for packet_id in packets]
+            self.advance()
+
+    def packet(self, packet_id):
+        """Build the packet of type `packet_id` for the current frame, as a bytearray."""
+        packet_type = HeaderFieldsToPacketType[(2020, 1, int(packet_id))]
+        packet = packet_type()
+        header = packet.header
+        header.packetFormat = 2020
+        header.gameMajorVersion = 1
+        header.gameMinorVersion = 18
+        header.packetVersion = 1
+        header.packetId = packet_id
+        header.sessionUID = self.session_uid
+        header.sessionTime = self.session_time
+        header.frameIdentifier = self.frame_identifier
+        header.playerCarIndex = 0
+        header.secondaryPlayerCarIndex = 255
+        getattr(self, "_fill_" + PacketID(packet_id).name.lower())(packet)
+        return bytearray(packet)
+
+    def _positions(self):
+        ranked = sorted(self.cars[: self.num_cars], key=lambda car: -car.total_distance)
+        return {car.index: position for position, car in enumerate(ranked, 1)}
+
+    def _fill_motion(self, packet):
+        for car, motion in zip(self.cars, packet.carMotionData):
+            angle = 2 * math.pi * car.lap_distance / self.track_length
+            radius = self.track_length / (2 * math.pi)
+            speed = car.speed / 3.6
+            motion.worldPositionX = radius * math.cos(angle)
+            motion.worldPositionZ = radius * math.sin(angle)
+            motion.worldVelocityX = -speed * math.sin(angle)
+            motion.worldVelocityZ = speed * math.cos(angle)
+            motion.worldForwardDirX = int(-32767 * math.sin(angle))
+            motion.worldForwardDirZ = int(32767 * math.cos(angle))
+            motion.worldRightDirX = int(32767 * math.cos(angle))
+            motion.worldRightDirZ = int(32767 * math.sin(angle))
+            motion.gForceLateral = speed * speed / radius / 9.81
+            motion.gForceLongitudinal = (car.speed - car.previous_speed) / 3.6 * self.rate / 9.81
+            motion.gForceVertical = 1.0
+            motion.yaw = angle
+        player = self.cars[0]
+        for wheel in range(4):
+            packet.wheelSpeed[wheel] = player.speed / 3.6
+            packet.wheelSlip[wheel] = self.rng.uniform(0, 0.05)
+            packet.suspensionPosition[wheel] = self.rng.uniform(10, 20)
+        packet.localVelocityZ = player.speed / 3.6
+
+    def _fill_session(self, packet):
+        packet.weather = 0
+        packet.trackTemperature = 34
+        packet.airTemperature = 24
+        packet.totalLaps = 50
+        packet.trackLength = self.track_length
+        packet.sessionType = 10
+        packet.trackId = 0
+        packet.formula = 0
+        packet.sessionTimeLeft = 7200
+        packet.sessionDuration = 7200
+        packet.pitSpeedLimit = 80
+        packet.numMarshalZones = 12
+        for zone, marshal_zone in enumerate(packet.marshalZones[:12]):
+            marshal_zone.zoneStart = zone / 12
+        packet.numWeatherForecastSamples = 5
+        for sample, forecast in enumerate(packet.weatherForecastSamples[:5]):
+            forecast.sessionType = 10
+            forecast.timeOffset = 5 * sample
+            forecast.trackTemperature = 34
+            forecast.airTemperature = 24
+
+    def _fill_lap_data(self, packet):
+        positions = self._positions()
+        for car, lap in zip(self.cars[: self.num_cars], packet.lapData):
+            lap.lastLapTime = car.last_lap_time
+            lap.currentLapTime = self.session_time - car.lap_start
+            lap.sector1TimeInMS = car.sector_times[0]
+            lap.sector2TimeInMS = car.sector_times[1]
+            lap.bestLapTime = car.best_lap_time
+            lap.lapDistance = car.lap_distance
+            lap.totalDistance = car.total_distance
+            lap.carPosition = positions[car.index]
+            lap.currentLapNum = car.lap_num
+            lap.sector = car.sector
+            lap.gridPosition = car.index + 1
+            lap.driverStatus = 4
+            lap.resultStatus = 2
+
+    def _fill_event(self, packet):
+        code = EVENT_CODES[(self.frame_identifier // (10 * self.rate)) % len(EVENT_CODES)]
+        packet.eventStringCode = code.value
+        car = self.rng.randrange(self.num_cars)
+        details = packet.eventDetails
+        if code is EventStringCode.FTLP:
+            details.fastestLap.vehicleIdx = car
+            details.fastestLap.lapTime = self.cars[car].best_lap_time
+        elif code is EventStringCode.PENA:
+            details.penalty.penaltyType = 4
+            details.penalty.infringementType = 7
+            details.penalty.vehicleIdx = car
+            details.penalty.otherVehicleIdx = 255
+            details.penalty.time = 5
+            details.penalty.lapNum = self.cars[car].lap_num
+        elif code is EventStringCode.SPTP:
+            details.speedTrap.vehicleIdx = car
+            details.speedTrap.speed = self.cars[car].speed
+        elif code in (EventStringCode.RCWN, EventStringCode.RTMT, EventStringCode.TMPT):
+            details.raceWinner.vehicleIdx = car
+
+    def _fill_participants(self, packet):
+        packet.numActiveCars = self.num_cars
+        for index, participant in enumerate(packet.participants[: self.num_cars]):
+            participant.aiControlled = int(index != 0)
+            participant.driverId = self.driver_ids[index]
+            participant.teamId = self.team_ids[index]
+            participant.raceNumber = index + 2
+            participant.nationality = 1 + index % 88
+            participant.name = DriverIDs[self.driver_ids[index]].encode()
+            participant.yourTelemetry = 1
+
+    def _fill_car_setups(self, packet):
+        for index, setup in enumerate(packet.carSetups[: self.num_cars]):
+            setup.frontWing = 5 + index % 3
+            setup.rearWing = 6 + index % 3
+            setup.onThrottle = 75
+            setup.offThrottle = 60
+            setup.frontCamber = -3.0
+            setup.rearCamber = -1.5
+            setup.frontToe = 0.05
+            setup.rearToe = 0.2
+            setup.frontSuspension = 5
+            setup.rearSuspension = 5
+            setup.frontAntiRollBar = 6
+            setup.rearAntiRollBar = 6
+            setup.frontSuspensionHeight = 3
+            setup.rearSuspensionHeight = 6
+            setup.brakePressure = 100
+            setup.brakeBias = 56
+            setup.rearLeftTyrePressure = 21.5
+            setup.rearRightTyrePressure = 21.5
+            setup.frontLeftTyrePressure = 23.0
+            setup.frontRightTyrePressure = 23.0
+            setup.fuelLoad = 100.0
+
+    def _fill_car_telemetry(self, packet):
+        for car, telemetry in zip(self.cars[: self.num_cars], packet.carTelemetryData):
+            telemetry.speed = int(car.speed)
+            telemetry.throttle = car.throttle
+            telemetry.steer = math.sin(car.phase + car.lap_distance / 200) * 0.3
+            telemetry.brake = car.brake
+            telemetry.gear = car.gear
+            telemetry.engineRPM = min(13000, 4000 + int(car.speed * 120) % 9000)
+            telemetry.drs = int(car.speed > 290)
+            telemetry.revLightsPercent = min(100, telemetry.engineRPM // 130)
+            for wheel in range(4):
+                telemetry.brakesTemperature[wheel] = int(car.brake_temperature[wheel])
+                telemetry.tyresSurfaceTemperature[wheel] = int(car.tyre_surface_temperature[wheel])
+                telemetry.tyresInnerTemperature[wheel] = int(car.tyre_inner_temperature[wheel])
+                telemetry.tyresPressure[wheel] = 23.0 if wheel >= 2 else 21.5
+            telemetry.engineTemperature = int(car.engine_temperature)
+        packet.suggestedGear = 0
+
+    def _fill_car_status(self, packet):
+        for car, status in zip(self.cars[: self.num_cars], packet.carStatusData):
+            status.fuelMix = 1
+            status.frontBrakeBias = 56
+            status.fuelInTank = car.fuel
+            status.fuelCapacity = 110.0
+            status.fuelRemainingLaps = car.fuel / 1.8
+            status.maxRPM = 13000
+            status.idleRPM = 4000
+            status.maxGears = 8
+            status.drsAllowed = 1
+            for wheel in range(4):
+                status.tyresWear[wheel] = int(car.tyre_wear[wheel])
+                status.tyresDamage[wheel] = int(car.tyre_wear[wheel])
+            status.actualTyreCompound = 17
+            status.visualTyreCompound = 17
+            status.tyresAgeLaps = car.lap_num - 1
+            status.ersStoreEnergy = car.ers
+            status.ersDeployMode = 2
+            status.ersDeployedThisLap = 4000000.0 - car.ers
+
+    def _fill_final_classification(self, packet):
+        packet.numCars = self.num_cars
+        positions = self._positions()
+        for car, classification in zip(self.cars[: self.num_cars], packet.classificationData):
+            classification.position = positions[car.index]
+            classification.numLaps = car.lap_num - 1
+            classification.gridPosition = car.index + 1
+            classification.resultStatus = 3
+            classification.bestLapTime = car.best_lap_time
+            classification.totalRaceTime = car.lap_start
+            classification.numTyreStints = 1
+            classification.tyreStintsActual[0] = 17
+            classification.tyreStintsVisual[0] = 17
+
+    def _fill_lobby_info(self, packet):
+        packet.numPlayers = self.num_cars
+        for index, player in enumerate(packet.lobbyPlayers[: self.num_cars]):
+            player.aiControlled = int(index != 0)
+            player.teamId = self.team_ids[index]
+            player.nationality = 1 + index % 88
+            player.name = DriverIDs[self.driver_ids[index]].encode()
+            player.readyStatus = 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send synthetic telemetry to an ingester")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=20777)
+    parser.add_argument("--rate", type=int, default=60, help="frames per second")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--cars", type=int, default=22)
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    generator = PacketGenerator(num_cars=args.cars, rate=args.rate)
+    started = time.monotonic()
+    for frame, datagrams in enumerate(generator.frames(int(args.seconds * args.rate))):
+        for datagram in datagrams:
+            sock.sendto(datagram, (args.host, args.port))
+        delay = started + (frame + 1) / args.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
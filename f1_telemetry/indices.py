@@ -0,0 +1,19 @@
+"""
+Names of the indices documents are written to, one data stream per document type
+
+Every name has an index template, installed by templates.install_templates, making it a data
+stream whose backing indices are rolled over by the "f1" lifecycle policy.
+"""
+SESSION_INDEX = "f1-session"
+LAP_INDEX = "f1-lap"
+TELEMETRY_INDEX = "f1-telemetry"
+STATUS_INDEX = "f1-status"
+SETUP_INDEX = "f1-setup"
+CLASSIFICATION_INDEX = "f1-classification"
+EVENT_INDEX = "f1-event"
+
+# Lap, telemetry and car status documents merged by FrameJoiner
+FRAME_INDEX = "f1-frame"
+
+# Summaries: sectors, laps, stints and motion, told apart by their "rollup" field
+ROLLUP_INDEX = "f1-rollup"
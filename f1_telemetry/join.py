@@ -0,0 +1,129 @@
+"""
+Frame joining: one wide document per car and frame instead of one per packet type
+
+The lap data, telemetry and car status packets of one game frame arrive as separate datagrams
+sharing header.frameIdentifier. FrameJoiner sits between PacketProcessor and the sink and
+merges the per-car documents of those packets that share (session, frameIdentifier, car) into
+one, holding each frame for `timeout` seconds so packets arriving late or out of order still
+join it. The per-frame documents of all_cars="frame", holding every car in lists, are keyed as
+car None so they only join each other. Merged documents are written to FRAME_INDEX and carry
+`packet_ids`, the packets they were built from, instead of `packet_id`.
+
+Documents of other packets, summaries ("rollup" documents) and priority documents pass through
+unchanged.
+"""
+import threading
+import time
+
+from indices import FRAME_INDEX
+from model.f1_2020_struct import PacketID
+
+# Packets whose per-car documents are joined
+JOINED_PACKETS = {PacketID.LAP_DATA, PacketID.CAR_TELEMETRY, PacketID.CAR_STATUS}
+
+
+class FrameJoiner:
+    """Sink wrapper merging the documents of one car and frame; see the module docstring.
+
+    Args:
+        sink: the sink merged and passed-through documents are written to.
+        timeout: seconds a frame is held for its other packets.
+    """
+
+    def __init__(self, sink, timeout=0.05):
+        self.sink = sink
+        self.timeout = timeout
+
+        self.joined = 0
+        self.written = 0
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._expires = 0.0
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="join-timer", daemon=True)
+        self._timer.start()
+
+    def add(self, index, doc):
+        if doc.get("packet_id") not in JOINED_PACKETS or "rollup" in doc:
+            self.sink.add(index, doc)
+            return
+
+        if "car_index" in doc:
+            car = doc["car_index"]
+        elif isinstance(doc.get("car_name"), list):
+            # all_cars="frame" documents hold every car in lists: join them only with each other
+            car = None
+        else:
+            car = doc.get("player_index")
+        key = (doc["session_UUID"], doc["frame_id"], car)
+        packet_id = doc.pop("packet_id")
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                merged = entry[1]
+                merged["packet_ids"].append(packet_id)
+                merged.update(doc)
+                self.joined += 1
+                return
+            now = time.monotonic()
+            doc["packet_ids"] = [packet_id]
+            self._pending[key] = (now + self.timeout, doc)
+            if len(self._pending) == 1:
+                self._expires = now + self.timeout
+            if now < self._expires:
+                return
+            expired = self._take_expired(now)
+        self._write(expired)
+
+    def add_priority(self, index, doc):
+        self.sink.add_priority(index, doc)
+
+    def flush(self):
+        """Write every pending frame, then flush the sink."""
+        with self._lock:
+            pending = self._take_all()
+        self._write(pending)
+        self.sink.flush()
+
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        with self._lock:
+            pending = self._take_all()
+        self._write(pending)
+        self.sink.close()
+
+    def stats(self):
+        stats = self.sink.stats()
+        stats.update({"joined": self.joined, "join_written": self.written, "join_pending": len(self._pending)})
+        return stats
+
+    def _take_expired(self, now):
+        """Remove and return the pending (key, doc) pairs whose deadline passed, oldest first."""
+        expired = []
+        for key, (deadline, doc) in self._pending.items():
+            if deadline > now:
+                self._expires = deadline
+                break
+            expired.append((key, doc))
+        for key, _ in expired:
+            del self._pending[key]
+        self.written += len(expired)
+        return expired
+
+    def _take_all(self):
+        pending = [(key, doc) for key, (_, doc) in self._pending.items()]
+        self._pending = {}
+        self.written += len(pending)
+        return pending
+
+    def _write(self, entries):
+        for key, doc in entries:
+            self.sink.add(FRAME_INDEX, doc)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.timeout / 2):
+            with self._lock:
+                expired = self._take_expired(time.monotonic())
+            self._write(expired)
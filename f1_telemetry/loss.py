@@ -0,0 +1,144 @@
+"""
+Packet loss, duplication and reordering detection
+
+The game stamps every packet with the frameIdentifier it was produced on, and sends the motion,
+lap data, telemetry and car status packets on every frame. LossTracker follows, for each
+(sessionUID, packetId), the highest frame seen and a bitmap of the WINDOW frames before it, in
+the way of a sliding replay window:
+
+- a frame ahead of the highest: new; the frames skipped are counted as lost for the packet
+  types sent on every frame,
+- a frame within the window not seen yet: reordered; it is no longer counted as lost,
+- a frame within the window already seen: duplicate, dropped if `drop_duplicates` is set,
+- a frame further back than the window: late, a straggler held up somewhere on the way, unless
+  RESET_AFTER such frames arrive in a row; the game then went back in time (flashback,
+  restart) and tracking starts again from the last of them.
+
+Only the packets sent on every frame are told duplicate by their frame: several events (a
+penalty for each car of a collision, a penalty then a fastest lap) can share one. The other
+packets are duplicates when their bytes equal one of the RECENT last packets of their type.
+
+State and work per packet are constant whatever the loss rate.
+"""
+from collections import deque
+
+from model.f1_2020_struct import PacketID
+
+# Frames remembered before the highest one seen
+WINDOW = 64
+
+MASK = (1 << WINDOW) - 1
+
+# Consecutive frames further back than the window telling a flashback from stragglers
+RESET_AFTER = 3
+
+# Packets remembered per type, for the packets not sent on every frame
+RECENT = 8
+
+# Packets sent on every frame, whose frame gaps are losses
+EVERY_FRAME_PACKETS = {PacketID.MOTION, PacketID.LAP_DATA, PacketID.CAR_TELEMETRY, PacketID.CAR_STATUS}
+
+# Sessions followed at once; more than one when several rigs share an ingester process
+MAX_SESSIONS = 16
+
+COUNTERS = ["received", "lost", "duplicates", "reordered", "late", "resets"]
+
+
+class FrameWindow:
+    """Highest frame seen and bitmap of the frames before it for one (sessionUID, packetId).
+
+    Bit n of `seen` is set when frame `last - n` was received. `recent` holds the last packets
+    received, for the packets not sent on every frame. `behind` counts the consecutive packets
+    of frames further back than the window.
+    """
+
+    __slots__ = ("last", "seen", "recent", "behind")
+
+    def __init__(self, frame):
+        self.last = frame
+        self.seen = 1
+        self.recent = deque(maxlen=RECENT)
+        self.behind = 0
+
+
+class LossTracker:
+    """Count lost, duplicate and reordered packets per packet type.
+
+    Args:
+        drop_duplicates: make `observe` reject duplicate packets, so they are not processed.
+    """
+
+    def __init__(self, drop_duplicates=False):
+        self.drop_duplicates = drop_duplicates
+        self.sessions = {}
+        self.counters = {packet_id: dict.fromkeys(COUNTERS, 0) for packet_id in PacketID}
+
+    def observe(self, header, data=b""):
+        """Account for a packet; return False if it is a duplicate to drop.
+
+        Args:
+            header: the PacketHeader of the packet.
+            data: the whole packet, compared with the recent packets of its type if it is not
+                sent on every frame.
+        """
+        counters = self.counters.get(header.packetId)
+        if counters is None:
+            return True
+        counters["received"] += 1
+        every_frame = header.packetId in EVERY_FRAME_PACKETS
+        windows = self._session(header.sessionUID)
+        frame = header.frameIdentifier
+        window = windows.get(header.packetId)
+        if window is None:
+            window = windows[header.packetId] = FrameWindow(frame)
+        else:
+            offset = window.last - frame
+            if offset < WINDOW:
+                window.behind = 0
+            if offset >= WINDOW:
+                window.behind += 1
+                if window.behind < RESET_AFTER:
+                    counters["late"] += 1
+                else:
+                    # The earlier late packets were the first ones after going back in time
+                    counters["late"] -= window.behind - 1
+                    counters["resets"] += 1
+                    window = windows[header.packetId] = FrameWindow(frame)
+            elif offset < 0:
+                if every_frame:
+                    counters["lost"] += -offset - 1
+                window.seen = ((window.seen << -offset) | 1) & MASK
+                window.last = frame
+            elif not window.seen & (1 << offset):
+                window.seen |= 1 << offset
+                counters["reordered"] += 1
+                if every_frame:
+                    counters["lost"] -= 1
+            elif every_frame:
+                counters["duplicates"] += 1
+                return not self.drop_duplicates
+        if every_frame:
+            return True
+
+        packet = bytes(data)
+        if packet in window.recent:
+            counters["duplicates"] += 1
+            return not self.drop_duplicates
+        window.recent.append(packet)
+        return True
+
+    def stats(self):
+        """Return the counters of every packet type received, by packet name."""
+        return {
+            PacketID(packet_id).name.lower(): dict(counters)
+            for packet_id, counters in self.counters.items()
+            if counters["received"]
+        }
+
+    def _session(self, session_uid):
+        windows = self.sessions.get(session_uid)
+        if windows is None:
+            if len(self.sessions) >= MAX_SESSIONS:
+                del self.sessions[next(iter(self.sessions))]
+            windows = self.sessions[session_uid] = {}
+        return windows
@@ -0,0 +1,66 @@
+"""NumPy structured dtypes for the F1 2020 UDP packet structures
+
+The dtypes are generated from the ctypes `_fields_` definitions in f1_2020_struct, using the
+ctypes field offsets and structure sizes, so both descriptions of a packet always agree on the
+byte layout. This lets a batch of raw datagrams of one packet type be decoded with a single
+np.frombuffer call into columnar arrays, instead of constructing a ctypes structure per packet:
+
+    batch = decode_packets(b"".join(datagrams), PacketCarTelemetryData_V1)
+    speeds = batch["carTelemetryData"]["speed"]  # shape (N, 22)
+"""
+
+import ctypes
+import functools
+
+import numpy as np
+
+from .f1_2020_struct import HeaderFieldsToPacketType, PacketHeader
+
+
+@functools.lru_cache(maxsize=None)
+def dtype_for(ctype) -> np.dtype:
+    """Return the packed little-endian NumPy dtype equivalent to a ctypes type.
+
+    Handles the scalar types, arrays, structures and unions used by the telemetry packets.
+    Char arrays become fixed-size byte strings; note that ctypes cuts these at the first NUL
+    while NumPy only strips trailing NULs, which only differs for garbage after the terminator.
+    """
+    if issubclass(ctype, ctypes.Array):
+        if ctype._type_ is ctypes.c_char:
+            return np.dtype(f"S{ctype._length_}")
+        return np.dtype((dtype_for(ctype._type_), (ctype._length_,)))
+
+    if issubclass(ctype, (ctypes.Structure, ctypes.Union)):
+        names = [field[0] for field in ctype._fields_]
+        return np.dtype(
+            {
+                "names": names,
+                "formats": [dtype_for(field[1]) for field in ctype._fields_],
+                "offsets": [getattr(ctype, name).offset for name in names],
+                "itemsize": ctypes.sizeof(ctype),
+            }
+        )
+
+    return np.dtype(ctype).newbyteorder("<")
+
+
+# Map from (packetFormat, packetVersion, packetId) to the dtype of the packet type.
+HeaderFieldsToDtype = {key: dtype_for(packet_type) for key, packet_type in HeaderFieldsToPacketType.items()}
+
+PacketHeaderDtype = dtype_for(PacketHeader)
+
+
+def decode_packets(buffer, packet_type) -> np.ndarray:
+    """Decode concatenated raw packets of a single type into a structured array, without copying.
+
+    Args:
+        buffer: bytes-like object holding N packets of `packet_type`, back to back.
+        packet_type: the ctypes packet structure, e.g. PacketLapData_V1.
+
+    Returns:
+        A read-only view of shape (N,) over `buffer`.
+
+    Raises:
+        ValueError if the buffer size is not a multiple of the packet size.
+    """
+    return np.frombuffer(buffer, dtype=dtype_for(packet_type))
@@ -0,0 +1,242 @@
+"""Compiled field extractors for the F1 2020 UDP packet structures
+
+A mapping declares which fields of a packet go into a document, as (document key, field path)
+or (document key, field path, converter) tuples. A field path follows the ctypes `_fields_`
+names, with `[n]` for an array element and `[]` for the element chosen by the `car` argument:
+
+    LAP_MAPPING = [
+        ("current_lap_num", "lapData[].currentLapNum"),
+        ("FL_brake_T", "carTelemetryData[].brakesTemperature[2]"),
+    ]
+
+Extractor resolves the paths against the ctypes layout once, groups the fields into as few
+struct.Struct formats as possible and generates a function that reads them with unpack_from at
+precomputed offsets. Extracting a document then costs a couple of C calls plus building the
+dict, instead of a ctypes struct proxy per array element and field access.
+"""
+
+import ctypes
+import re
+import struct
+
+from .f1_2020_struct import HeaderFieldsToPacketType, PackedLittleEndianStructure
+
+# struct format of every scalar ctypes type used by the packets; ctypes._type_ codes cannot be
+# used directly since c_uint64 is 'L', which struct takes to be 4 bytes
+STRUCT_FORMATS = {
+    ctypes.c_uint8: "B",
+    ctypes.c_int8: "b",
+    ctypes.c_uint16: "H",
+    ctypes.c_int16: "h",
+    ctypes.c_uint32: "I",
+    ctypes.c_int32: "i",
+    ctypes.c_uint64: "Q",
+    ctypes.c_int64: "q",
+    ctypes.c_float: "f",
+    ctypes.c_double: "d",
+}
+
+_SEGMENT = re.compile(r"^(\w+)(?:\[(\d*)\])?$")
+
+
+class FieldSpec:
+    """A leaf field resolved to its position in the packet."""
+
+    __slots__ = ("key", "offset", "format", "per_car", "is_string", "convert")
+
+    def __init__(self, key, offset, format, per_car, is_string, convert):
+        self.key = key
+        self.offset = offset
+        self.format = format
+        self.per_car = per_car
+        self.is_string = is_string
+        self.convert = convert
+
+    @property
+    def size(self):
+        return struct.calcsize("<" + self.format)
+
+
+def resolve(packet_type, path):
+    """Resolve a field path to (offset, struct format, per-car stride or 0, is string).
+
+    Raises:
+        ValueError if the path does not name a scalar or char array field of `packet_type`.
+    """
+    ctype = packet_type
+    offset = 0
+    stride = 0
+    for segment in path.split("."):
+        match = _SEGMENT.match(segment)
+        if match is None or not issubclass(ctype, (ctypes.Structure, ctypes.Union)):
+            raise ValueError(f"Bad field path {path!r} for {packet_type.__name__}")
+        name, index = match.groups()
+        if name not in dict(ctype._fields_):
+            raise ValueError(f"No field {name!r} in {ctype.__name__} (path {path!r})")
+        offset += getattr(ctype, name).offset
+        ctype = dict(ctype._fields_)[name]
+        if index is None:
+            continue
+        if not issubclass(ctype, ctypes.Array):
+            raise ValueError(f"Field {name!r} in path {path!r} is not an array")
+        element_size = ctypes.sizeof(ctype._type_)
+        if index == "":
+            if stride:
+                raise ValueError(f"Path {path!r} has more than one per-car index")
+            stride = element_size
+        else:
+            if int(index) >= ctype._length_:
+                raise ValueError(f"Index {index} out of range in path {path!r}")
+            offset += int(index) * element_size
+        ctype = ctype._type_
+
+    if issubclass(ctype, ctypes.Array) and ctype._type_ is ctypes.c_char:
+        return offset, f"{ctype._length_}s", stride, True
+    if ctype not in STRUCT_FORMATS:
+        raise ValueError(f"Path {path!r} does not end at a scalar field")
+    return offset, STRUCT_FORMATS[ctype], stride, False
+
+
+def full_mapping(ctype, prefix="", key_prefix="", per_car=None):
+    """Generate a mapping for every leaf field of a structure.
+
+    Keys are the field names joined with underscores, e.g. "tyresWear_0". `per_car` names the
+    array field to index with the `car` argument; all other arrays are expanded element by
+    element.
+    """
+    mapping = []
+    for name, field_type in ctype._fields_:
+        path = prefix + name
+        key = key_prefix + name
+        if issubclass(field_type, ctypes.Array) and field_type._type_ is not ctypes.c_char:
+            if name == per_car:
+                mapping += full_mapping(field_type._type_, path + "[].", "")
+            elif issubclass(field_type._type_, (ctypes.Structure, ctypes.Union)):
+                for index in range(field_type._length_):
+                    mapping += full_mapping(field_type._type_, f"{path}[{index}].", f"{key}_{index}_")
+            else:
+                mapping += [(f"{key}_{index}", f"{path}[{index}]") for index in range(field_type._length_)]
+        elif issubclass(field_type, (ctypes.Structure, ctypes.Union)):
+            mapping += full_mapping(field_type, path + ".", key + "_")
+        else:
+            mapping.append((key, path))
+    return mapping
+
+
+def _group(specs):
+    """Split field specs into runs that can each be read by one struct.Struct.
+
+    Fields are sorted by offset; a run ends where a field overlaps the previous one (unions).
+    Returns a list of (start offset, format, [spec, ...]) with pad bytes between fields.
+    """
+    groups = []
+    for spec in sorted(specs, key=lambda spec: spec.offset):
+        if groups and spec.offset >= groups[-1][1]:
+            start, end, fmt, members = groups[-1]
+            groups[-1] = (start, spec.offset + spec.size, fmt + "x" * (spec.offset - end) + spec.format, members + [spec])
+        else:
+            groups.append((spec.offset, spec.offset + spec.size, spec.format, [spec]))
+    return [(start, fmt, members) for start, _, fmt, members in groups]
+
+
+class Extractor:
+    """Extract a document from a raw packet of one type, as declared by a mapping.
+
+    Call it with a buffer holding the packet and the index of the car to use for `[]` path
+    segments: `extractor(data, car)`. The generated source is available as `source`.
+    """
+
+    def __init__(self, packet_type, mapping):
+        self.packet_type = packet_type
+        self.mapping = list(mapping)
+        self.stride = 0
+
+        specs = []
+        for entry in self.mapping:
+            key, path = entry[0], entry[1]
+            convert = entry[2] if len(entry) > 2 else None
+            offset, fmt, stride, is_string = resolve(packet_type, path)
+            if stride:
+                if self.stride and stride != self.stride:
+                    raise ValueError(f"Mapping for {packet_type.__name__} indexes arrays of different strides")
+                self.stride = stride
+            specs.append(FieldSpec(key, offset, fmt, bool(stride), is_string, convert))
+
+        namespace = {}
+        lines = ["def extract(buffer, car=0):"]
+        if self.stride:
+            lines.append(f"    base = car * {self.stride}")
+        slots = {}
+        for number, per_car in enumerate((False, True)):
+            for index, (start, fmt, members) in enumerate(_group([spec for spec in specs if spec.per_car == per_car])):
+                name = f"v{number}_{index}"
+                namespace[f"unpack_{name}"] = struct.Struct("<" + fmt).unpack_from
+                position = f"base + {start}" if per_car else f"{start}"
+                lines.append(f"    {name} = unpack_{name}(buffer, {position})")
+                for slot, spec in enumerate(members):
+                    slots[spec] = f"{name}[{slot}]"
+
+        items = []
+        for number, spec in enumerate(specs):
+            value = slots[spec]
+            if spec.is_string:
+                value = f'{value}.split(b"\\0", 1)[0]'
+            if spec.convert is not None:
+                namespace[f"convert_{number}"] = spec.convert
+                value = f"convert_{number}({value})"
+            items.append(f"        {spec.key!r}: {value},")
+        lines += ["    return {"] + items + ["    }"]
+
+        self.source = "\n".join(lines)
+        exec(compile(self.source, f"<extractor {packet_type.__name__}>", "exec"), namespace)
+        self._extract = namespace["extract"]
+
+    def __call__(self, buffer, car=0):
+        return self._extract(buffer, car)
+
+
+def ctypes_extract(packet, mapping, car=0):
+    """Reference implementation of Extractor, walking a decoded ctypes packet attribute by attribute."""
+    doc = {}
+    for entry in mapping:
+        value = packet
+        for segment in entry[1].split("."):
+            name, index = _SEGMENT.match(segment).groups()
+            value = getattr(value, name)
+            if index is not None:
+                value = value[car if index == "" else int(index)]
+        doc[entry[0]] = entry[2](value) if len(entry) > 2 else value
+    return doc
+
+
+def columns(mapping):
+    """Turn a per-car mapping into (document key, struct field, element index or None) columns.
+
+    The columns index the NumPy view of the per-car array, see model.dtypes; converters are
+    not applied.
+    """
+    result = []
+    for entry in mapping:
+        field = entry[1].split("[].", 1)[1]
+        name, _, element = field.partition("[")
+        result.append((entry[0], name, int(element[:-1]) if element else None))
+    return result
+
+
+def _per_car_field(packet_type):
+    """Return the name of the 22-element array of structures in a packet type, if any."""
+    for name, field_type in packet_type._fields_:
+        if (
+            issubclass(field_type, ctypes.Array)
+            and issubclass(field_type._type_, PackedLittleEndianStructure)
+            and field_type._length_ == 22
+        ):
+            return name
+    return None
+
+
+# Complete mappings of every packet type, with the per-car array (if any) indexed by `car`
+FullMappings = {
+    packet_type: full_mapping(packet_type, per_car=_per_car_field(packet_type))
+    for packet_type in HeaderFieldsToPacketType.values()
+}
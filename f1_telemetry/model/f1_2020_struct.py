@@ -397,27 +397,16 @@ class PacketEventData_V1(PackedLittleEndianStructure):
     ]
 
     def __repr__(self):
-        event = self.eventStringCode.decode()
+        event = self.eventStringCode
 
-        if event in ["CHQF", "DRSD", "DRSE", "SEND", "SSTA"]:
+        if event not in EventStringCodeToDetails:
+            raise RuntimeError(f"Bad event code {event.decode()}")
+
+        details = EventStringCodeToDetails[event]
+        if details is None:
             end = ")"
         else:
-            if event == "FTLP":
-                event_details = self.eventDetails.fastestLap
-            elif event == "PENA":
-                event_details = self.eventDetails.penalty
-            elif event == "RCWN":
-                event_details = self.eventDetails.raceWinner
-            elif event == "RTMT":
-                event_details = self.eventDetails.retirement
-            elif event == "SPTP":
-                event_details = self.eventDetails.speedTrap
-            elif event == "TMPT":
-                event_details = self.eventDetails.teamMateInPits
-            else:
-                raise RuntimeError(f"Bad event code {event}")
-
-            end = f", eventDetails={event_details!r})"
+            end = f", eventDetails={getattr(self.eventDetails, details)!r})"
 
         return f"{self.__class__.__name__}(header={self.header!r}, eventStringCode={self.eventStringCode!r}{end}"
 
@@ -473,6 +462,21 @@ EventStringCode.long_description = {
     EventStringCode.SPTP: "Speed trap has been triggered",
 }
 
+# Map from eventStringCode to the EventDataDetails member holding the event's details, or None.
+EventStringCodeToDetails = {
+    EventStringCode.SSTA.value: None,
+    EventStringCode.SEND.value: None,
+    EventStringCode.FTLP.value: "fastestLap",
+    EventStringCode.RTMT.value: "retirement",
+    EventStringCode.DRSE.value: None,
+    EventStringCode.DRSD.value: None,
+    EventStringCode.TMPT.value: "teamMateInPits",
+    EventStringCode.CHQF.value: None,
+    EventStringCode.RCWN.value: "raceWinner",
+    EventStringCode.PENA.value: "penalty",
+    EventStringCode.SPTP.value: "speedTrap",
+}
+
 ###############################################################
 #                                                             #
 #  __________  Packet ID 4 : PARTICIPANTS PACKET  __________  #
@@ -805,6 +809,9 @@ HeaderFieldsToPacketType = {
     (2020, 1, 9): PacketLobbyInfoData_V1,
 }
 
+# Map from packet type to its (packetFormat, packetVersion, packetId).
+PacketTypeToHeaderFields = {packet_type: key for key, packet_type in HeaderFieldsToPacketType.items()}
+
 
 class UnpackError(Exception):
     """Exception for packets that cannot be unpacked"""
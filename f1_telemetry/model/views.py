@@ -0,0 +1,216 @@
+"""Lazy views of the F1 2020 UDP packet structures
+
+A view wraps a memoryview of a raw packet and reads a field only when it is accessed, with
+struct.unpack_from at the offset taken from the ctypes layout. The value is then cached on the
+view, so repeated reads are plain attribute lookups. Nested structures and arrays of structures
+are views themselves, so reading three fields of a packet decodes three fields:
+
+    packet = view_packet(datagram)
+    speed = packet.carTelemetryData[packet.header.playerCarIndex].speed
+
+The view classes are generated from the `_fields_` of each structure by view_for and mirror the
+ctypes attribute names. Arrays of scalars are read at once into a tuple and char arrays become
+bytes cut at the first NUL, as with ctypes. A PacketHeader field is read as a Header namedtuple.
+A view reads the underlying buffer on demand, so the buffer must not be reused while the view
+is in use.
+
+read_header decodes the 24-byte PacketHeader with a single unpack_from. view_packet does the
+same, routes on the decoded values and keeps the header on the view it returns.
+"""
+
+import collections
+import ctypes
+import functools
+import struct
+
+from .extractors import STRUCT_FORMATS
+from .f1_2020_struct import HeaderFieldsToPacketType, PacketHeader, UnpackError
+
+HEADER = struct.Struct("<" + "".join(STRUCT_FORMATS[field_type] for _, field_type in PacketHeader._fields_))
+
+Header = collections.namedtuple("Header", [name for name, _ in PacketHeader._fields_])
+
+# Header._make without its length check: HEADER always unpacks one value per field
+_new_header = functools.partial(tuple.__new__, Header)
+
+
+def read_header(buffer) -> Header:
+    """Decode the PacketHeader at the start of a raw packet."""
+    return _new_header(HEADER.unpack_from(buffer))
+
+
+class _Field:
+    """Non-data descriptor decoding one field and caching it in the instance dict.
+
+    Subclasses decode in __get__ itself rather than through a shared helper: the field is read
+    once per view, and an extra Python call would cost as much as the read.
+    """
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset
+
+
+class _Scalar(_Field):
+    def __init__(self, name, offset, fmt):
+        super().__init__(name, offset)
+        self.unpack_from = struct.Struct("<" + fmt).unpack_from
+
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = view.__dict__[self.name] = self.unpack_from(view._buffer, view._offset + self.offset)[0]
+        return value
+
+
+class _ScalarArray(_Scalar):
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = view.__dict__[self.name] = self.unpack_from(view._buffer, view._offset + self.offset)
+        return value
+
+
+class _String(_Scalar):
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = self.unpack_from(view._buffer, view._offset + self.offset)[0].split(b"\0", 1)[0]
+        view.__dict__[self.name] = value
+        return value
+
+
+class _Header(_Field):
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = view.__dict__[self.name] = _new_header(HEADER.unpack_from(view._buffer, view._offset + self.offset))
+        return value
+
+
+class _Struct(_Field):
+    def __init__(self, name, offset, view_type):
+        super().__init__(name, offset)
+        self.view_type = view_type
+
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = view.__dict__[self.name] = self.view_type(view._buffer, view._offset + self.offset)
+        return value
+
+
+class _StructArray(_Field):
+    def __init__(self, name, offset, view_type, length):
+        super().__init__(name, offset)
+        self.view_type = view_type
+        self.length = length
+
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        value = ArrayView(self.view_type, view._buffer, view._offset + self.offset, self.length)
+        view.__dict__[self.name] = value
+        return value
+
+
+class StructView:
+    """Base class of the generated views; `_ctype` is the structure a view class mirrors."""
+
+    _ctype = None
+    _size = 0
+
+    def __init__(self, buffer, offset=0):
+        self._buffer = buffer
+        self._offset = offset
+
+    def __repr__(self):
+        return f"<{type(self).__name__} at offset {self._offset}>"
+
+
+class ArrayView:
+    """Sequence of views over an array of structures, created on first access."""
+
+    def __init__(self, view_type, buffer, offset, length):
+        self._view_type = view_type
+        self._buffer = buffer
+        self._offset = offset
+        self._stride = view_type._size
+        self._items = [None] * length
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if item is None:
+            if index < 0:
+                index += len(self._items)
+            item = self._items[index] = self._view_type(self._buffer, self._offset + index * self._stride)
+        return item
+
+    def __iter__(self):
+        for index in range(len(self._items)):
+            yield self[index]
+
+
+@functools.lru_cache(maxsize=None)
+def view_for(ctype):
+    """Return the view class for a ctypes structure or union, generated from its `_fields_`."""
+    attributes = {"__doc__": f"Lazy view of {ctype.__name__}.", "_ctype": ctype, "_size": ctypes.sizeof(ctype)}
+    for name, field_type in ctype._fields_:
+        offset = getattr(ctype, name).offset
+        if issubclass(field_type, ctypes.Array):
+            element = field_type._type_
+            if element is ctypes.c_char:
+                attributes[name] = _String(name, offset, f"{field_type._length_}s")
+            elif issubclass(element, (ctypes.Structure, ctypes.Union)):
+                attributes[name] = _StructArray(name, offset, view_for(element), field_type._length_)
+            else:
+                attributes[name] = _ScalarArray(name, offset, f"{field_type._length_}{STRUCT_FORMATS[element]}")
+        elif field_type is PacketHeader:
+            attributes[name] = _Header(name, offset)
+        elif issubclass(field_type, (ctypes.Structure, ctypes.Union)):
+            attributes[name] = _Struct(name, offset, view_for(field_type))
+        else:
+            attributes[name] = _Scalar(name, offset, STRUCT_FORMATS[field_type])
+    return type(f"{ctype.__name__}View", (StructView,), attributes)
+
+
+# Map from (packetFormat, packetVersion, packetId) to the view class of the packet type.
+HeaderFieldsToView = {key: view_for(packet_type) for key, packet_type in HeaderFieldsToPacketType.items()}
+
+
+def view_packet(packet) -> StructView:
+    """Wrap a raw UDP packet in the view of its type, decoding only its header and copying nothing.
+
+    The lazy counterpart of unpack_udp_packet, with the same checks.
+
+    Args:
+        packet: bytes-like object holding the contents of the UDP packet.
+
+    Returns:
+        A view of the packet structure.
+
+    Raises:
+        UnpackError if a problem is detected.
+    """
+    if len(packet) < HEADER.size:
+        raise UnpackError(f"Bad telemetry packet: too short ({len(packet)} bytes).")
+
+    values = HEADER.unpack_from(packet)
+    key = (values[0], values[3], values[4])
+    view_type = HeaderFieldsToView.get(key)
+    if view_type is None:
+        raise UnpackError(f"Bad telemetry packet: no match for key fields {key!r}.")
+
+    if len(packet) != view_type._size:
+        raise UnpackError(
+            f"Bad telemetry packet: bad size for {view_type._ctype.__name__} packet; "
+            f"expected {view_type._size} bytes but received {len(packet)} bytes."
+        )
+    view = view_type(packet)
+    view.header = _new_header(values)
+    return view
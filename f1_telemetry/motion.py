@@ -0,0 +1,203 @@
+"""
+Columnar ring buffers for the motion packets
+
+Motion packets (world position, velocity, g-forces and orientation of every car, plus the
+player car's suspension and wheels) arrive at up to 60 Hz and are too many to index one by one.
+MotionBuffers decodes each packet into preallocated NumPy ring buffers holding the last
+`window` seconds of every session, one array per channel, and writes one summary document per
+car every 1 / `rate` seconds of session time.
+
+The ring buffers can be read in place by in-process analytics:
+
+    ring = processor.motion.ring(session_uid)
+    for part in ring.column("gForceLateral", last=600):  # views, oldest first, shape (n, 22)
+        ...
+"""
+import numpy as np
+
+from indices import ROLLUP_INDEX
+from model.dtypes import dtype_for
+from model.f1_2020_struct import PacketMotionData_V1
+
+MOTION_DTYPE = dtype_for(PacketMotionData_V1)
+CAR_DTYPE = MOTION_DTYPE["carMotionData"].base
+
+CARS = 22
+
+# Per-car channels, from CarMotionData_V1
+CAR_CHANNELS = list(CAR_DTYPE.names)
+
+# Player car channels, the fields after carMotionData
+PLAYER_CHANNELS = [name for name in MOTION_DTYPE.names if name not in ("header", "carMotionData")]
+
+# Highest motion packet rate the game can be set to; ring buffers are sized for it
+MAX_RATE = 60
+
+# Sessions buffered at once; a 5 minute window takes about 30 MB per session
+MAX_SESSIONS = 4
+
+
+class MotionRing:
+    """The last `capacity` motion packets of one session, one preallocated array per channel.
+
+    Per-car channels have shape (capacity, 22), player car channels (capacity,) or
+    (capacity, 4). `count` is the number of packets appended since the ring was created; the
+    packet appended n-th (from 0) is in slot n % capacity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.session_time = np.zeros(capacity)
+        self.frame_id = np.zeros(capacity, dtype=np.uint32)
+        self.columns = {name: np.zeros((capacity, CARS), dtype=CAR_DTYPE[name]) for name in CAR_CHANNELS}
+        for name in PLAYER_CHANNELS:
+            self.columns[name] = np.zeros((capacity,) + MOTION_DTYPE[name].shape, dtype=MOTION_DTYPE[name].base)
+
+    def append(self, header, packet):
+        """Store one decoded packet, a record of MOTION_DTYPE, overwriting the oldest if full."""
+        slot = self.count % self.capacity
+        self.session_time[slot] = header.sessionTime
+        self.frame_id[slot] = header.frameIdentifier
+        cars = packet["carMotionData"]
+        columns = self.columns
+        for name in CAR_CHANNELS:
+            columns[name][slot] = cars[name]
+        for name in PLAYER_CHANNELS:
+            columns[name][slot] = packet[name]
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def slices(self, last=None):
+        """Return the slots of the `last` packets (all buffered packets if None), oldest first.
+
+        The result is a list of at most two slices, two when the range wraps around the end of
+        the buffers.
+        """
+        n = len(self) if last is None else min(last, len(self))
+        if not n:
+            return []
+        start = (self.count - n) % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            return [slice(start, end)]
+        return [slice(start, self.capacity), slice(0, end - self.capacity)]
+
+    def column(self, name, last=None):
+        """Return views of a channel over the `last` packets, oldest first, without copying."""
+        column = self.columns[name] if name in self.columns else getattr(self, name)
+        return [column[part] for part in self.slices(last)]
+
+    def ordered(self, name, last=None):
+        """Return a channel over the `last` packets as one contiguous copy, oldest first."""
+        parts = self.column(name, last)
+        return parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
+
+
+class SessionMotion:
+    """Ring buffer and emission state of one session."""
+
+    def __init__(self, capacity):
+        self.ring = MotionRing(capacity)
+        self.last_emit_time = None
+        self.last_emit_count = 0
+
+
+class MotionBuffers:
+    """Buffer motion packets per session and summarise them per car at a fixed rate.
+
+    Args:
+        sink: where summary documents are written.
+        session_states: the SessionCache providing participant names, timestamps and the number
+            of cars.
+        window: seconds of motion data kept per session, at the highest packet rate.
+        rate: summary documents per car per second of session time; 0 only fills the buffers.
+    """
+
+    def __init__(self, sink, session_states, window=300, rate=1.0):
+        self.sink = sink
+        self.session_states = session_states
+        self.capacity = int(window * MAX_RATE)
+        self.interval = 1.0 / rate if rate else None
+        self.sessions = {}
+
+    def ring(self, session_uid):
+        """Return the MotionRing of a session, or None if no motion packet was seen for it."""
+        session = self.sessions.get(session_uid)
+        return session.ring if session is not None else None
+
+    def add(self, header, data):
+        session = self._session(header.sessionUID)
+        session.ring.append(header, np.frombuffer(data, dtype=MOTION_DTYPE, count=1)[0])
+
+        if self.interval is None:
+            return
+        if session.last_emit_time is None or header.sessionTime < session.last_emit_time:
+            # First packet, or the session clock went back (flashback, restart)
+            session.last_emit_time = header.sessionTime
+            session.last_emit_count = session.ring.count - 1
+            return
+        if header.sessionTime - session.last_emit_time >= self.interval:
+            self._emit(header, session)
+            session.last_emit_time = header.sessionTime
+            session.last_emit_count = session.ring.count
+
+    def _emit(self, header, session):
+        ring = session.ring
+        samples = min(ring.count - session.last_emit_count, len(ring))
+        state = self.session_states.get(header.sessionUID)
+        count = state.num_active_cars
+        names = state.car_names(count)
+
+        def latest(name):
+            return ring.columns[name][(ring.count - 1) % ring.capacity][:count].tolist()
+
+        velocity = np.stack(
+            [ring.ordered(name, samples)[:, :count] for name in ("worldVelocityX", "worldVelocityY", "worldVelocityZ")]
+        )
+        g_lateral = ring.ordered("gForceLateral", samples)[:, :count]
+        g_longitudinal = ring.ordered("gForceLongitudinal", samples)[:, :count]
+        g_vertical = ring.ordered("gForceVertical", samples)[:, :count]
+        columns = {
+            "world_position_x": latest("worldPositionX"),
+            "world_position_y": latest("worldPositionY"),
+            "world_position_z": latest("worldPositionZ"),
+            "speed_mean": (np.sqrt((velocity.astype(np.float64) ** 2).sum(axis=0)).mean(axis=0) * 3.6).round(2).tolist(),
+            "g_lateral_max": np.abs(g_lateral).max(axis=0).tolist(),
+            "g_longitudinal_min": g_longitudinal.min(axis=0).tolist(),
+            "g_longitudinal_max": g_longitudinal.max(axis=0).tolist(),
+            "g_vertical_max": g_vertical.max(axis=0).tolist(),
+            "yaw": latest("yaw"),
+            "pitch": latest("pitch"),
+            "roll": latest("roll"),
+        }
+        keys = list(columns)
+
+        base = {
+            "@timestamp": state.timestamp(header.sessionTime),
+            "session_ts": header.sessionTime,
+            "session_UUID": str(header.sessionUID),
+            "frame_id": header.frameIdentifier,
+            "rollup": "motion",
+            "samples": samples,
+        }
+        for index, row in enumerate(zip(*columns.values())):
+            doc = base.copy()
+            doc["car_index"] = index
+            doc["car_name"] = names[index]
+            doc.update(zip(keys, row))
+            if index == header.playerCarIndex:
+                doc["wheel_slip_max"] = np.abs(ring.ordered("wheelSlip", samples)).max(axis=0).tolist()
+                suspension = ring.ordered("suspensionPosition", samples)
+                doc["suspension_travel"] = (suspension.max(axis=0) - suspension.min(axis=0)).tolist()
+            self.sink.add(ROLLUP_INDEX, doc)
+
+    def _session(self, session_uid):
+        session = self.sessions.get(session_uid)
+        if session is None:
+            if len(self.sessions) >= MAX_SESSIONS:
+                del self.sessions[next(iter(self.sessions))]
+            session = self.sessions[session_uid] = SessionMotion(self.capacity)
+        return session
@@ -0,0 +1,97 @@
+"""
+Bounded queue between the UDP receiver and the document-building workers
+"""
+import logging
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class Pipeline:
+    """Hand datagrams from the event loop to worker threads.
+
+    `put` never blocks: when the queue is full the datagram is dropped and counted, so the
+    receiving socket is always drained. Workers call `handler(item)` for every queued item.
+
+    Keep `workers` at 1 when the handler holds per-session state that depends on packet order.
+    """
+
+    def __init__(self, handler, queue_size=10000, workers=1):
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_count = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"pipeline-{i}", daemon=True) for i in range(workers)
+        ]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, item):
+        """Enqueue `item` without waiting; return False if it was dropped."""
+        try:
+            self.queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def close(self):
+        """Process everything already queued, then stop the workers."""
+        for _ in self._workers:
+            self.queue.put((0.0, _STOP))
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        """Return counters and the worker latency since the previous call.
+
+        Latency is measured from enqueue to the end of the handler call.
+        """
+        with self._lock:
+            count = self._latency_count
+            mean = self._latency_total / count if count else 0.0
+            peak = self._latency_max
+            self._latency_total = self._latency_max = 0.0
+            self._latency_count = 0
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "errors": self.errors,
+            "latency_mean_ms": round(mean * 1000, 3),
+            "latency_max_ms": round(peak * 1000, 3),
+        }
+
+    def _work(self):
+        while True:
+            enqueued_at, item = self.queue.get()
+            if item is _STOP:
+                return
+            try:
+                self.handler(item)
+            except Exception:
+                logging.exception("Failed to process packet")
+                with self._lock:
+                    self.errors += 1
+            latency = time.monotonic() - enqueued_at
+            with self._lock:
+                self.processed += 1
+                self._latency_total += latency
+                self._latency_count += 1
+                if latency > self._latency_max:
+                    self._latency_max = latency
@@ -0,0 +1,418 @@
+"""
+Decoding of raw telemetry datagrams into Elasticsearch documents
+"""
+import time
+
+import numpy as np
+
+from model.dtypes import dtype_for
+from delta import DeltaEncoder
+from dispatch import HandlerRegistry, packet_ids
+from events import EventPublisher
+from indices import CLASSIFICATION_INDEX, LAP_INDEX, SESSION_INDEX, TELEMETRY_INDEX
+from loss import LossTracker
+from model.extractors import Extractor, columns
+from model.f1_2020_struct import *
+from model.views import read_header, view_for
+from motion import MotionBuffers
+from rollup import LapRollup
+from session import SessionCache
+from setups import SetupTracker
+from status import StatusTracker
+
+# Fields of the per-car documents: (document key, field path[, converter]), see model.extractors
+LAP_MAPPING = [
+    ("last_lap_time", "lapData[].lastLapTime"),
+    ("current_lap_time", "lapData[].currentLapTime"),
+    ("best_lap_time", "lapData[].bestLapTime"),
+    ("s1", "lapData[].sector1TimeInMS"),
+    ("s2", "lapData[].sector2TimeInMS"),
+    ("lap_distance", "lapData[].lapDistance"),
+    ("total_distance", "lapData[].totalDistance"),
+    ("car_position", "lapData[].carPosition"),
+    ("current_lap_num", "lapData[].currentLapNum"),
+    ("pit_status", "lapData[].pitStatus"),
+    ("sector", "lapData[].sector"),
+    ("lap_invalid", "lapData[].currentLapInvalid"),
+    ("penalities", "lapData[].penalties"),
+    ("grid_pos", "lapData[].gridPosition"),
+    ("driver_status", "lapData[].driverStatus"),
+    ("result_status", "lapData[].resultStatus"),
+]
+
+TELEMETRY_MAPPING = [
+    ("speed", "carTelemetryData[].speed"),
+    ("throttle", "carTelemetryData[].throttle"),
+    ("steering", "carTelemetryData[].steer"),
+    ("brake", "carTelemetryData[].brake"),
+    ("clutch", "carTelemetryData[].clutch"),
+    ("gear", "carTelemetryData[].gear"),
+    ("engine_RPM", "carTelemetryData[].engineRPM"),
+    ("DRS_enabled", "carTelemetryData[].drs"),
+    ("dev_lights", "carTelemetryData[].revLightsPercent"),
+    ("FL_brake_T", "carTelemetryData[].brakesTemperature[0]"),
+    ("FR_brake_T", "carTelemetryData[].brakesTemperature[1]"),
+    ("RL_brake_T", "carTelemetryData[].brakesTemperature[2]"),
+    ("RR_brake_T", "carTelemetryData[].brakesTemperature[3]"),
+    ("FL_tyre_surface_T", "carTelemetryData[].tyresSurfaceTemperature[0]"),
+    ("FR_tyre_surface_T", "carTelemetryData[].tyresSurfaceTemperature[1]"),
+    ("RL_tyre_surface_T", "carTelemetryData[].tyresSurfaceTemperature[2]"),
+    ("RR_tyre_surface_T", "carTelemetryData[].tyresSurfaceTemperature[3]"),
+    ("FL_tyre_inner_T", "carTelemetryData[].tyresInnerTemperature[0]"),
+    ("FR_tyre_inner_T", "carTelemetryData[].tyresInnerTemperature[1]"),
+    ("RL_tyre_inner_T", "carTelemetryData[].tyresInnerTemperature[2]"),
+    ("RR_tyre_inner_T", "carTelemetryData[].tyresInnerTemperature[3]"),
+    ("engine_T", "carTelemetryData[].engineTemperature"),
+    ("FL_tyre_pressure", "carTelemetryData[].tyresPressure[0]"),
+    ("FR_tyre_pressure", "carTelemetryData[].tyresPressure[1]"),
+    ("RL_tyre_pressure", "carTelemetryData[].tyresPressure[2]"),
+    ("RR_tyre_pressure", "carTelemetryData[].tyresPressure[3]"),
+    ("FL_diving_surface", "carTelemetryData[].surfaceType[0]"),
+    ("FR_tyre_surface", "carTelemetryData[].surfaceType[1]"),
+    ("RL_tyre_surface", "carTelemetryData[].surfaceType[2]"),
+    ("RR_tyre_surface", "carTelemetryData[].surfaceType[3]"),
+]
+
+CLASSIFICATION_MAPPING = [
+    ("position", "classificationData[].position"),
+    ("num_laps", "classificationData[].numLaps"),
+    ("grid_position", "classificationData[].gridPosition"),
+    ("points", "classificationData[].points"),
+    ("num_pit_stops", "classificationData[].numPitStops"),
+    ("result_status", "classificationData[].resultStatus"),
+    ("best_lap_time", "classificationData[].bestLapTime"),
+    ("total_race_time", "classificationData[].totalRaceTime"),
+    ("penalties_time", "classificationData[].penaltiesTime"),
+    ("num_penalties", "classificationData[].numPenalties"),
+    ("num_tyre_stints", "classificationData[].numTyreStints"),
+]
+
+# packetId -> (packet dtype, per-car array field, columns, index) for the packets handled in all-cars mode
+ALL_CARS_PACKETS = {
+    PacketID.LAP_DATA: (dtype_for(PacketLapData_V1), "lapData", columns(LAP_MAPPING), LAP_INDEX),
+    PacketID.CAR_TELEMETRY: (
+        dtype_for(PacketCarTelemetryData_V1),
+        "carTelemetryData",
+        columns(TELEMETRY_MAPPING),
+        TELEMETRY_INDEX,
+    ),
+    PacketID.FINAL_CLASSIFICATION: (
+        dtype_for(PacketFinalClassificationData_V1),
+        "classificationData",
+        columns(CLASSIFICATION_MAPPING),
+        CLASSIFICATION_INDEX,
+    ),
+}
+
+# Player car extractors, compiled once at import
+LAP_EXTRACTOR = Extractor(PacketLapData_V1, LAP_MAPPING)
+TELEMETRY_EXTRACTOR = Extractor(PacketCarTelemetryData_V1, TELEMETRY_MAPPING)
+CLASSIFICATION_EXTRACTOR = Extractor(PacketFinalClassificationData_V1, CLASSIFICATION_MAPPING)
+
+SESSION_VIEW = view_for(PacketSessionData_V1)
+PARTICIPANTS_VIEW = view_for(PacketParticipantsData_V1)
+
+# Bytes of eventStringCode in an event packet
+EVENT_CODE = slice(PacketEventData_V1.eventStringCode.offset, PacketEventData_V1.eventStringCode.offset + 4)
+
+# Byte of numCars in a final classification packet
+CLASSIFICATION_NUM_CARS = PacketFinalClassificationData_V1.numCars.offset
+
+
+class PacketProcessor:
+    """Decode datagrams and write the resulting documents to a sink.
+
+    Keeps a SessionState per session, fed by the session, lap data and participants packets, to
+    enrich documents; a single instance must see the packets of a session in order.
+
+    Packets are read in place from the given buffer rather than copied, so `data` must not be
+    reused until `process` returns.
+
+    By default only the player car is indexed. With `all_cars` set to "car", lap, telemetry and
+    final classification packets produce one document per active car; with "frame" they produce
+    one document per packet holding a list per field, indexed by car.
+
+    With `rollup` set, lap data and telemetry packets also feed a LapRollup that writes per-sector
+    and per-lap summaries; `raw=False` then stops their per-packet documents.
+
+    With `delta` set, telemetry documents (player or per car) only carry the fields that changed
+    since the car's previous document, plus a complete keyframe every `keyframe_interval` seconds;
+    see DeltaEncoder.
+
+    With `motion` set, motion packets are kept in per-session ring buffers covering the last
+    `motion_window` seconds, summarised per car `motion_rate` times per second; see
+    MotionBuffers.
+
+    With `status` set, car status packets produce a document per car whenever its fuel, ERS,
+    tyre or damage values change meaningfully, and at least every `status_interval` seconds; see
+    StatusTracker.
+
+    `@timestamp` is derived from the packet's sessionTime, anchored once per session to the time
+    its first packet was received (`received_at`, or now if not given); `timestamp_format` is
+    "iso" or "epoch_millis", see session.TIMESTAMP_FORMATS.
+
+    With `setups` set, car setup packets produce a document per car when its setup changes; see
+    SetupTracker.
+
+    With `loss` set, lost, duplicate and reordered packets are counted per packet type from their
+    frameIdentifier (and bytes, for the packets not sent on every frame), see LossTracker;
+    `drop_duplicates` also drops duplicate packets unprocessed.
+
+    Event packets produce one document per event, written through the sink's priority lane; see
+    EventPublisher, on `events`, for subscribing to them.
+
+    Packets are routed through `handlers`, a HandlerRegistry, on their header alone. `packets`
+    limits the handled packet types to the given names (e.g. ["session", "lap_data"], see
+    PacketID); other packets are dropped after reading their header. Handlers for more packet
+    types or for events can be registered on `handlers`.
+    """
+
+    def __init__(
+        self,
+        sink,
+        all_cars=None,
+        rollup=False,
+        raw=True,
+        delta=False,
+        keyframe_interval=1.0,
+        timestamp_format="iso",
+        motion=False,
+        motion_window=300,
+        motion_rate=1.0,
+        status=False,
+        status_interval=5.0,
+        setups=False,
+        loss=False,
+        drop_duplicates=False,
+        packets=None,
+    ):
+        if all_cars not in (None, "car", "frame"):
+            raise ValueError(f"Bad all_cars mode {all_cars!r}")
+        self.sink = sink
+        self.all_cars = all_cars
+        self.raw = raw
+        self.sessions = SessionCache(timestamp_format=timestamp_format)
+        self.delta = None
+        if delta:
+            self.delta = DeltaEncoder([entry[0] for entry in TELEMETRY_MAPPING], keyframe_interval=keyframe_interval)
+        self.rollup = None
+        if rollup:
+            self.rollup = LapRollup(sink, self.sessions)
+        self.motion = None
+        if motion:
+            self.motion = MotionBuffers(sink, self.sessions, window=motion_window, rate=motion_rate)
+        self.status = None
+        if status:
+            self.status = StatusTracker(sink, self.sessions, interval=status_interval)
+        self.setups = None
+        if setups:
+            self.setups = SetupTracker(sink, self.sessions)
+
+        self.loss = None
+        if loss or drop_duplicates:
+            self.loss = LossTracker(drop_duplicates=drop_duplicates)
+        self.events = EventPublisher(sink, self.sessions)
+
+        self.handlers = HandlerRegistry()
+        self.handlers.register(PacketSessionData_V1, self.handle_session)
+        self.handlers.register(PacketLapData_V1, self.handle_lap_data)
+        self.handlers.register(PacketEventData_V1, self.handle_event)
+        self.handlers.register(PacketParticipantsData_V1, self.handle_participants)
+        self.handlers.register(PacketCarTelemetryData_V1, self.handle_telemetry)
+        self.handlers.register(PacketFinalClassificationData_V1, self.handle_final_classification)
+        if self.motion is not None:
+            self.handlers.register(PacketMotionData_V1, self.handle_motion)
+        if self.status is not None:
+            self.handlers.register(PacketCarStatusData_V1, self.handle_car_status)
+        if self.setups is not None:
+            self.handlers.register(PacketCarSetupData_V1, self.handle_car_setups)
+        for event in EventStringCode:
+            self.handlers.register_event(event, self.events.handle)
+        if packets is not None:
+            self.handlers.restrict(packet_ids(packets))
+
+    def process(self, data, received_at=None):
+        header = read_header(data)
+        if self.loss is not None and not self.loss.observe(header, data):
+            return
+        handler = self.handlers.get(header)
+        if handler is None:
+            return
+        session = self.sessions.get(header.sessionUID)
+        if session.epoch is None:
+            session.anchor(header.sessionTime, time.time() if received_at is None else received_at)
+        handler(header, session, data)
+
+    def handle_motion(self, header, session, data):
+        self.motion.add(header, data)
+
+    def handle_session(self, header, session, data):
+        packet = SESSION_VIEW(data)
+        session.update_session(packet)
+        data = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "session_UUID": str(header.sessionUID),
+            "frame_id": header.frameIdentifier,
+            "track": session.track,
+            "type": session.session_type,
+            "weather": session.weather,
+            "car_type": session.formula,
+            "track_temp": packet.trackTemperature,
+            "air_temp": packet.airTemperature,
+            "total_laps": packet.totalLaps,
+            "track_length": packet.trackLength,
+        }
+        data["name"] = f"{data['track']} - {data['type']} - {data['weather']} - {session.started}"
+        self.sink.add(SESSION_INDEX, data)
+
+    def handle_lap_data(self, header, session, data):
+        session.update_lap_data(data)
+        if self.rollup is not None:
+            self.rollup.add_lap_data(header, data)
+        if not self.raw:
+            return
+        if self.all_cars:
+            self.process_all_cars(header, session, data, *ALL_CARS_PACKETS[PacketID.LAP_DATA])
+            return
+
+        player = header.playerCarIndex
+        doc = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+            "player_index": player,
+            **session.player_fields(player),
+            "lap_uuid": f"{header.sessionUID}-{player}-{header.frameIdentifier}",
+        }
+        doc.update(LAP_EXTRACTOR(data, player))
+        self.sink.add(LAP_INDEX, doc)
+
+    def handle_event(self, header, session, data):
+        handler, event = self.handlers.get_event(bytes(data[EVENT_CODE]))
+        if handler is not None:
+            handler(header, session, data, event)
+
+    def handle_participants(self, header, session, data):
+        session.update_participants(PARTICIPANTS_VIEW(data))
+
+    def handle_telemetry(self, header, session, data):
+        if self.rollup is not None:
+            self.rollup.add_telemetry(header, data)
+        if not self.raw:
+            return
+        if self.all_cars:
+            self.process_all_cars(header, session, data, *ALL_CARS_PACKETS[PacketID.CAR_TELEMETRY])
+            return
+
+        player = header.playerCarIndex
+        doc = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+            "player_index": player,
+            **session.player_fields(player),
+            "current_lap_num": session.lap_status["current_lap_num"][player],
+            "sector": session.lap_status["sector"][player],
+        }
+        doc.update(TELEMETRY_EXTRACTOR(data, player))
+        if self.delta is not None:
+            doc = self.delta.encode((header.sessionUID, player), doc, header.sessionTime)
+            if doc is None:
+                return
+        self.sink.add(TELEMETRY_INDEX, doc)
+
+    def handle_car_setups(self, header, session, data):
+        self.setups.add(header, data)
+
+    def handle_car_status(self, header, session, data):
+        self.status.add(header, data)
+
+    def handle_final_classification(self, header, session, data):
+        if self.all_cars:
+            self.process_all_cars(
+                header,
+                session,
+                data,
+                *ALL_CARS_PACKETS[PacketID.FINAL_CLASSIFICATION],
+                count=data[CLASSIFICATION_NUM_CARS],
+            )
+            return
+
+        player = header.playerCarIndex
+        doc = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+            "player_index": player,
+            **session.player_fields(player),
+        }
+        doc.update(CLASSIFICATION_EXTRACTOR(data, player))
+        self.sink.add(CLASSIFICATION_INDEX, doc)
+
+    def process_all_cars(self, header, session, data, dtype, array_field, columns, index, count=None):
+        """Build documents for every active car from one packet.
+
+        The packet is viewed through its NumPy dtype so each column is read for all cars with a
+        single tolist() call, rather than through a ctypes struct proxy per car and field.
+
+        Args:
+            count: number of cars in the packet, when it carries its own (final classification);
+                the session's numActiveCars otherwise, 22 before the participants packet.
+        """
+        if count is None:
+            count = session.num_active_cars
+        cars = np.frombuffer(data, dtype=dtype, count=1)[0][array_field][:count]
+        keys = [column[0] for column in columns]
+        values = [
+            cars[field].tolist() if element is None else cars[field][:, element].tolist()
+            for _, field, element in columns
+        ]
+
+        base = {
+            "session_ts": header.sessionTime,
+            "@timestamp": session.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+            "player_index": header.playerCarIndex,
+        }
+
+        telemetry = array_field == "carTelemetryData"
+        lap_nums = session.lap_status["current_lap_num"]
+        sectors = session.lap_status["sector"]
+
+        if self.all_cars == "frame":
+            base.update(session.car_columns(count))
+            if telemetry:
+                base["current_lap_num"] = lap_nums[:count]
+                base["sector"] = sectors[:count]
+            base.update(zip(keys, values))
+            self.sink.add(index, base)
+            return
+
+        for car, row in enumerate(zip(*values)):
+            doc = base.copy()
+            doc["car_index"] = car
+            doc.update(session.car_fields(car))
+            if array_field == "lapData":
+                doc["lap_uuid"] = f"{header.sessionUID}-{car}-{header.frameIdentifier}"
+            elif telemetry:
+                doc["current_lap_num"] = lap_nums[car]
+                doc["sector"] = sectors[car]
+            doc.update(zip(keys, row))
+            if self.delta is not None and telemetry:
+                doc = self.delta.encode((header.sessionUID, car), doc, header.sessionTime)
+                if doc is None:
+                    continue
+            self.sink.add(index, doc)
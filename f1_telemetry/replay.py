@@ -0,0 +1,204 @@
+"""
+Replay of captured sessions through the normal decoding and document building path
+
+Usage:
+
+    python replay.py CAPTURE_DIR [CAPTURE_DIR ...] [--speed 1.0] [--session UID] [--lap N] [--frame N] [--dry-run]
+
+Without --speed, packets are replayed as fast as possible. Capture files are memory-mapped, so
+packets are decoded straight from the page cache without being read into Python objects first.
+"""
+import argparse
+import ctypes
+import glob
+import logging
+import mmap
+import os
+import struct
+import time
+
+from capture import INDEX_ENTRY, RECORD_HEADER
+from join import FrameJoiner
+from model.f1_2020_struct import PacketID, PacketLapData_V1
+from model.views import view_for
+from processor import PacketProcessor
+from sink import BulkSink, NullSink
+from templates import install_templates
+
+LAP_DATA_VIEW = view_for(PacketLapData_V1)
+
+
+class CaptureReader:
+    """Read the records of a capture directory written by CaptureWriter.
+
+    Segments are mapped read-only; PacketProcessor reads packets in place, so the yielded
+    memoryviews are handed to it as they are. A mapping is closed once the last view onto it
+    has been dropped.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = sorted(glob.glob(os.path.join(directory, "capture-*.bin")))
+
+    def records(self, start=(0, 0)):
+        """Yield (receive time, datagram view) for every record from `start` onwards.
+
+        Args:
+            start: (segment number, byte offset) of the first record, as returned by `seek`.
+        """
+        first_segment, offset = start
+        for segment in range(first_segment, len(self.segments)):
+            view = self._map(segment)
+            if view is None:
+                continue
+            end = len(view)
+            while offset < end:
+                if offset + RECORD_HEADER.size > end:
+                    break
+                received_at, size = RECORD_HEADER.unpack_from(view, offset)
+                offset += RECORD_HEADER.size
+                if offset + size > end:
+                    break
+                yield received_at, view[offset : offset + size]
+                offset += size
+            if offset < end:
+                # Writes are buffered: an ingester stopped abruptly leaves the last record cut short
+                logging.warning("Skipping truncated record at the end of %s", self.segments[segment])
+            offset = 0
+
+    def index(self, segment):
+        """Return the (sessionUID, packetId, frameIdentifier, offset) entries of a segment."""
+        with open(self.segments[segment][:-4] + ".idx", "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        return INDEX_ENTRY.iter_unpack(data[:usable])
+
+    def seek(self, session=None, lap=None, frame=None):
+        """Find the first record matching the session, lap and/or frame, using the indexes.
+
+        A lap is matched against the player car's currentLapNum in lap data packets. Returns a
+        (segment number, byte offset) position for `records`, or None if nothing matches.
+        """
+        for segment in range(len(self.segments)):
+            view = None
+            for session_uid, packet_id, frame_id, offset in self.index(segment):
+                if session is not None and session_uid != session:
+                    continue
+                if frame is not None and frame_id < frame:
+                    continue
+                if lap is not None:
+                    if packet_id != PacketID.LAP_DATA:
+                        continue
+                    if view is None:
+                        view = self._map(segment)
+                    if offset + RECORD_HEADER.size + ctypes.sizeof(PacketLapData_V1) > len(view):
+                        continue
+                    packet = LAP_DATA_VIEW(view, offset + RECORD_HEADER.size)
+                    if packet.lapData[packet.header.playerCarIndex].currentLapNum < lap:
+                        continue
+                return segment, offset
+        return None
+
+    def _map(self, segment):
+        with open(self.segments[segment], "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def replay(reader, handler, start=(0, 0), speed=None):
+    """Feed captured datagrams to `handler`.
+
+    Args:
+        reader: the CaptureReader to replay.
+        handler: called with a read-only view of each datagram and its original receive time,
+            e.g. PacketProcessor.process, so documents get the timestamps of the live session.
+        start: position to start from, as returned by CaptureReader.seek.
+        speed: None to replay as fast as possible, otherwise a multiplier of the original pace.
+
+    Returns:
+        (number of packets, elapsed seconds).
+    """
+    started = time.monotonic()
+    first_received = None
+    count = 0
+    for received_at, datagram in reader.records(start):
+        if speed:
+            if first_received is None:
+                first_received = received_at
+            delay = (received_at - first_received) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            handler(datagram, received_at)
+        except (ValueError, KeyError, IndexError, struct.error):
+            logging.debug("Skipping packet that failed to process", exc_info=True)
+        count += 1
+    return count, time.monotonic() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured telemetry sessions")
+    parser.add_argument("captures", nargs="+", help="capture directories, replayed in order")
+    parser.add_argument("--speed", type=float, help="pace multiplier, e.g. 1 for real time (default: unthrottled)")
+    parser.add_argument("--session", type=int, help="start at this sessionUID")
+    parser.add_argument("--lap", type=int, help="start at this lap of the player car")
+    parser.add_argument("--frame", type=int, help="start at this frameIdentifier")
+    parser.add_argument("--all-cars", choices=["car", "frame"], help="index every car, see PacketProcessor")
+    parser.add_argument("--rollup", action="store_true", help="write per-sector and per-lap summaries")
+    parser.add_argument("--no-raw", action="store_true", help="skip per-packet lap and telemetry documents")
+    parser.add_argument("--delta", action="store_true", help="write only changed telemetry fields, see DeltaEncoder")
+    parser.add_argument("--motion", action="store_true", help="buffer motion packets and write motion summaries")
+    parser.add_argument("--status", action="store_true", help="write car status documents, see StatusTracker")
+    parser.add_argument("--join", action="store_true", help="merge the documents of one car and frame, see FrameJoiner")
+    parser.add_argument("--setups", action="store_true", help="write car setups when they change, see SetupTracker")
+    parser.add_argument("--loss", action="store_true", help="count lost, duplicate and reordered packets, see LossTracker")
+    parser.add_argument("--packets", help="comma-separated packet types to handle, e.g. session,lap_data (default: all)")
+    parser.add_argument("--timestamp-format", choices=["iso", "epoch_millis"], default="iso", help="@timestamp format")
+    parser.add_argument("--dry-run", action="store_true", help="build documents without sending them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.dry_run:
+        sink = NullSink()
+    else:
+        sink = BulkSink(hosts=os.environ.get("F1_ES_HOSTS", "http://es01:9200").split(","))
+        install_templates(sink.es)
+    if args.join:
+        sink = FrameJoiner(sink)
+    processor = PacketProcessor(
+        sink,
+        all_cars=args.all_cars,
+        rollup=args.rollup,
+        raw=not args.no_raw,
+        delta=args.delta,
+        timestamp_format=args.timestamp_format,
+        motion=args.motion,
+        status=args.status,
+        setups=args.setups,
+        loss=args.loss,
+        packets=args.packets.split(",") if args.packets else None,
+    )
+
+    total_count = 0
+    total_elapsed = 0.0
+    for directory in args.captures:
+        reader = CaptureReader(directory)
+        start = (0, 0)
+        if args.session is not None or args.lap is not None or args.frame is not None:
+            start = reader.seek(session=args.session, lap=args.lap, frame=args.frame)
+            if start is None:
+                logging.info("%s: no matching records", directory)
+                continue
+        count, elapsed = replay(reader, processor.process, start=start, speed=args.speed)
+        logging.info("%s: %d packets in %.2fs", directory, count, elapsed)
+        total_count += count
+        total_elapsed += elapsed
+
+    sink.close()
+    logging.info("Sink stats: %s", sink.stats())
+    if processor.loss is not None:
+        logging.info("Packet loss stats: %s", processor.loss.stats())
+    if total_elapsed:
+        logging.info("Throughput: %.0f packets/s", total_count / total_elapsed)
@@ -0,0 +1,231 @@
+"""
+Streaming per-sector and per-lap telemetry summaries
+
+Instead of one document per telemetry packet, LapRollup keeps fixed-size accumulators for every
+car and writes one summary document each time a car completes a sector or a lap, as reported
+by the lap data packets. Telemetry samples update the sector accumulators only; a finished
+sector is merged into the lap accumulators, so the per-packet cost does not depend on how
+many summaries are kept.
+"""
+import numpy as np
+
+from indices import ROLLUP_INDEX
+from model.dtypes import dtype_for
+from model.f1_2020_struct import PacketCarTelemetryData_V1, PacketLapData_V1
+
+TELEMETRY_DTYPE = dtype_for(PacketCarTelemetryData_V1)
+LAP_DTYPE = dtype_for(PacketLapData_V1)
+
+CARS = 22
+
+# Gears -1 (reverse) to 8, histogram bucket = gear + 1
+GEARS = 10
+
+# Pedal application above which a sample counts towards the throttle or brake time share
+PEDAL_THRESHOLD = 0.05
+
+# Sessions kept at once; more than one when several rigs share an ingester process
+MAX_SESSIONS = 16
+
+# Longest gap between telemetry packets credited to a sample, so pauses do not skew time shares
+MAX_SAMPLE_INTERVAL = 0.5
+
+
+class Accumulators:
+    """Running aggregates for all cars, one row per car."""
+
+    def __init__(self):
+        self.samples = np.zeros(CARS, dtype=np.int64)
+        self.duration = np.zeros(CARS)
+        self.speed_sum = np.zeros(CARS)
+        self.speed_min = np.full(CARS, np.inf)
+        self.speed_max = np.zeros(CARS)
+        self.throttle_time = np.zeros(CARS)
+        self.brake_time = np.zeros(CARS)
+        self.drs_time = np.zeros(CARS)
+        self.gear_time = np.zeros((CARS, GEARS))
+        self.brake_temperature_max = np.zeros((CARS, 4))
+        self.tyre_surface_temperature_max = np.zeros((CARS, 4))
+        self.tyre_inner_temperature_max = np.zeros((CARS, 4))
+
+    def update(self, cars, dt):
+        """Add one telemetry sample for every car, weighted by `dt` seconds for time shares."""
+        speed = cars["speed"]
+        self.samples += 1
+        self.duration += dt
+        self.speed_sum += speed
+        np.minimum(self.speed_min, speed, out=self.speed_min)
+        np.maximum(self.speed_max, speed, out=self.speed_max)
+        self.throttle_time += (cars["throttle"] > PEDAL_THRESHOLD) * dt
+        self.brake_time += (cars["brake"] > PEDAL_THRESHOLD) * dt
+        self.drs_time += (cars["drs"] != 0) * dt
+        self.gear_time[np.arange(CARS), np.clip(cars["gear"] + 1, 0, GEARS - 1)] += dt
+        np.maximum(self.brake_temperature_max, cars["brakesTemperature"], out=self.brake_temperature_max)
+        np.maximum(
+            self.tyre_surface_temperature_max, cars["tyresSurfaceTemperature"], out=self.tyre_surface_temperature_max
+        )
+        np.maximum(self.tyre_inner_temperature_max, cars["tyresInnerTemperature"], out=self.tyre_inner_temperature_max)
+
+    def merge(self, other, car):
+        """Fold the row of `car` from `other` into this set of accumulators."""
+        self.samples[car] += other.samples[car]
+        self.duration[car] += other.duration[car]
+        self.speed_sum[car] += other.speed_sum[car]
+        self.speed_min[car] = min(self.speed_min[car], other.speed_min[car])
+        self.speed_max[car] = max(self.speed_max[car], other.speed_max[car])
+        self.throttle_time[car] += other.throttle_time[car]
+        self.brake_time[car] += other.brake_time[car]
+        self.drs_time[car] += other.drs_time[car]
+        self.gear_time[car] += other.gear_time[car]
+        np.maximum(self.brake_temperature_max[car], other.brake_temperature_max[car], out=self.brake_temperature_max[car])
+        np.maximum(
+            self.tyre_surface_temperature_max[car],
+            other.tyre_surface_temperature_max[car],
+            out=self.tyre_surface_temperature_max[car],
+        )
+        np.maximum(
+            self.tyre_inner_temperature_max[car],
+            other.tyre_inner_temperature_max[car],
+            out=self.tyre_inner_temperature_max[car],
+        )
+
+    def reset(self, car):
+        self.samples[car] = 0
+        self.duration[car] = 0.0
+        self.speed_sum[car] = 0.0
+        self.speed_min[car] = np.inf
+        self.speed_max[car] = 0.0
+        self.throttle_time[car] = 0.0
+        self.brake_time[car] = 0.0
+        self.drs_time[car] = 0.0
+        self.gear_time[car] = 0.0
+        self.brake_temperature_max[car] = 0.0
+        self.tyre_surface_temperature_max[car] = 0.0
+        self.tyre_inner_temperature_max[car] = 0.0
+
+    def summary(self, car):
+        """Return the document fields for `car`, or None if it has no samples."""
+        samples = int(self.samples[car])
+        if not samples:
+            return None
+        duration = float(self.duration[car])
+        share = (lambda value: round(float(value) / duration, 4)) if duration else (lambda value: 0.0)
+        return {
+            "samples": samples,
+            "duration": round(duration, 3),
+            "speed_min": float(self.speed_min[car]),
+            "speed_max": float(self.speed_max[car]),
+            "speed_mean": round(float(self.speed_sum[car]) / samples, 2),
+            "throttle_share": share(self.throttle_time[car]),
+            "brake_share": share(self.brake_time[car]),
+            "drs_time": round(float(self.drs_time[car]), 3),
+            "gear_time": {str(gear - 1): round(t, 3) for gear, t in enumerate(self.gear_time[car].tolist()) if t},
+            "peak_brake_T": self.brake_temperature_max[car].tolist(),
+            "peak_tyre_surface_T": self.tyre_surface_temperature_max[car].tolist(),
+            "peak_tyre_inner_T": self.tyre_inner_temperature_max[car].tolist(),
+        }
+
+
+class SessionRollup:
+    """Accumulators and last known lap position of every car in one session."""
+
+    def __init__(self):
+        self.sector = Accumulators()
+        self.lap = Accumulators()
+        self.last_telemetry_time = None
+        self.lap_num = None
+        self.sector_num = None
+        self.sector_times = None
+
+
+class LapRollup:
+    """Summarise car telemetry per sector and per lap.
+
+    Args:
+        sink: where summary documents are written.
+        session_states: the SessionCache providing participant names and the number of cars.
+    """
+
+    def __init__(self, sink, session_states):
+        self.sink = sink
+        self.session_states = session_states
+        self.sessions = {}
+
+    def add_telemetry(self, header, data):
+        session = self._session(header.sessionUID)
+        cars = np.frombuffer(data, dtype=TELEMETRY_DTYPE, count=1)[0]["carTelemetryData"]
+        if session.last_telemetry_time is None:
+            dt = 0.0
+        else:
+            dt = min(max(header.sessionTime - session.last_telemetry_time, 0.0), MAX_SAMPLE_INTERVAL)
+        session.last_telemetry_time = header.sessionTime
+        session.sector.update(cars, dt)
+
+    def add_lap_data(self, header, data):
+        session = self._session(header.sessionUID)
+        cars = np.frombuffer(data, dtype=LAP_DTYPE, count=1)[0]["lapData"]
+        lap_num = cars["currentLapNum"].copy()
+        sector_num = cars["sector"].copy()
+        sector_times = np.stack([cars["sector1TimeInMS"], cars["sector2TimeInMS"]], axis=1).astype(np.int64)
+
+        if session.lap_num is not None:
+            num_active_cars = self.session_states.get(header.sessionUID).num_active_cars
+            changed = np.nonzero((lap_num != session.lap_num) | (sector_num != session.sector_num))[0]
+            for car in changed.tolist():
+                if car >= num_active_cars:
+                    continue
+                self._close_sector(header, session, car, cars, lap_num[car] != session.lap_num[car])
+
+        session.lap_num = lap_num
+        session.sector_num = sector_num
+        session.sector_times = sector_times
+
+    def _close_sector(self, header, session, car, cars, lap_changed):
+        lap = int(session.lap_num[car])
+        sector = int(session.sector_num[car])
+        s1, s2 = session.sector_times[car].tolist()
+        last_lap_time = float(cars["lastLapTime"][car])
+
+        sector_time = None
+        if sector == 0:
+            sector_time = s1 or int(cars["sector1TimeInMS"][car]) or None
+        elif sector == 1:
+            sector_time = s2 or int(cars["sector2TimeInMS"][car]) or None
+        elif lap_changed and s1 and s2:
+            sector_time = int(round(last_lap_time * 1000)) - s1 - s2
+
+        summary = session.sector.summary(car)
+        if summary is not None:
+            self._emit(header, car, "sector", lap, summary, sector=sector + 1, sector_time_ms=sector_time)
+        session.lap.merge(session.sector, car)
+        session.sector.reset(car)
+
+        if lap_changed:
+            summary = session.lap.summary(car)
+            if summary is not None:
+                self._emit(header, car, "lap", lap, summary, lap_time=last_lap_time)
+            session.lap.reset(car)
+
+    def _emit(self, header, car, rollup, lap, summary, **extra):
+        session = self.session_states.get(header.sessionUID)
+        doc = {
+            "@timestamp": session.timestamp(header.sessionTime),
+            "session_ts": header.sessionTime,
+            "session_UUID": str(header.sessionUID),
+            "frame_id": header.frameIdentifier,
+            "rollup": rollup,
+            "car_index": car,
+            "car_name": session.car_name(car),
+            "lap_num": lap,
+        }
+        doc.update(extra)
+        doc.update(summary)
+        self.sink.add(ROLLUP_INDEX, doc)
+
+    def _session(self, session_uid):
+        session = self.sessions.get(session_uid)
+        if session is None:
+            if len(self.sessions) >= MAX_SESSIONS:
+                del self.sessions[next(iter(self.sessions))]
+            session = self.sessions[session_uid] = SessionRollup()
+        return session
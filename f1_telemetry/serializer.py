@@ -0,0 +1,50 @@
+"""
+Serialization of _bulk request bodies
+
+BulkSink hands each batch of (index, document) pairs to a serializer's `bulk_body` method and
+sends the returned bytes as is. Any object with that method can be plugged in.
+
+NdjsonSerializer encodes each document once with a single reused C JSON encoder and reuses the
+encoded action line of every index; the body is joined and converted to UTF-8 in one pass. The
+elasticsearch client's own path instead creates an encoder per json.dumps call, serializes the
+action of every document as well, and encodes the joined string afterwards.
+"""
+import datetime
+import json
+
+import numpy as np
+
+
+def default(value):
+    """Encode the non-JSON types that documents may carry: NumPy scalars and arrays, dates."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Unable to serialize {value!r} (type: {type(value)})")
+
+
+class NdjsonSerializer:
+    """Build _bulk NDJSON bodies from (index, document) pairs."""
+
+    def __init__(self):
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=default).encode
+        self._actions = {}
+
+    def action(self, index):
+        """Return the action line for `index`, newline included.
+
+        The action is "create", the only one data streams accept; documents get generated ids.
+        """
+        line = self._actions.get(index)
+        if line is None:
+            line = self._actions[index] = self._encode({"create": {"_index": index}}) + "\n"
+        return line
+
+    def bulk_body(self, batch):
+        """Return the NDJSON body indexing every (index, document) pair of `batch`, as bytes."""
+        encode = self._encode
+        action = self.action
+        return "".join([action(index) + encode(doc) + "\n" for index, doc in batch]).encode()
@@ -0,0 +1,205 @@
+"""
+In-memory state of the sessions seen by the ingester
+
+SessionState holds what is known about one session (track, session type, weather, participants
+and the latest lap status of every car), updated incrementally from the session (1), lap data
+(2) and participants (4) packets. Table lookups such as TrackIDs or DriverIDs are done once
+when those packets arrive, so document building only needs attribute and list lookups, and an
+unknown value never raises.
+
+Document timestamps follow the game clock: the first packet of a session anchors its
+sessionTime to the wall-clock time the packet was received, and every later `@timestamp` is
+that epoch plus the packet's sessionTime. Timestamps are then cheap to compute and keep the
+game's ordering and spacing however late the packet is processed (buffering, replay).
+"""
+import time
+
+import numpy as np
+
+from model.dtypes import dtype_for
+from model.f1_2020_struct import Formula, PacketLapData_V1, SessionsType, TrackIDs, Weather
+from model.types import DriverIDs, NationalityIDs, TeamIDs
+
+LAP_DTYPE = dtype_for(PacketLapData_V1)
+
+# Lap data fields kept per car: (attribute of SessionState.lap_status, LapData_V1 field)
+LAP_STATUS_FIELDS = [
+    ("car_position", "carPosition"),
+    ("current_lap_num", "currentLapNum"),
+    ("sector", "sector"),
+    ("pit_status", "pitStatus"),
+    ("driver_status", "driverStatus"),
+    ("result_status", "resultStatus"),
+]
+
+# Participant attributes added to documents, as player_<attribute> for the player car and
+# car_<attribute> for the other cars
+PARTICIPANT_FIELDS = ["name", "driver", "team", "nationality", "race_number", "ai_controlled"]
+PLAYER_KEYS = ["player_" + field for field in PARTICIPANT_FIELDS]
+CAR_KEYS = ["car_" + field for field in PARTICIPANT_FIELDS]
+
+# Participant fields of a car before the participants packet
+UNKNOWN_PLAYER = dict.fromkeys(PLAYER_KEYS)
+UNKNOWN_CAR = dict.fromkeys(CAR_KEYS)
+
+# Sessions kept at once; more than one when several rigs share an ingester process
+MAX_SESSIONS = 16
+
+
+class IsoTimestamp:
+    """Format seconds since the Unix epoch as an ISO 8601 UTC date with microseconds.
+
+    Consecutive packets mostly fall within the same second, so the date and time part is
+    formatted once per second and only the fraction per call.
+    """
+
+    def __init__(self):
+        self._second = (None, None)
+
+    def __call__(self, seconds):
+        second = int(seconds)
+        cached, prefix = self._second
+        if second != cached:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._second = (second, prefix)
+        return "%s.%06d" % (prefix, (seconds - second) * 1e6)
+
+
+def epoch_millis(seconds):
+    return int(seconds * 1000)
+
+
+# Formatter factories by @timestamp format; epoch_millis needs @timestamp mapped as a date beforehand
+TIMESTAMP_FORMATS = {"iso": IsoTimestamp, "epoch_millis": lambda: epoch_millis}
+
+
+class Participant:
+    """A participant with its ids resolved to display values.
+
+    `player_fields` and `car_fields` hold the same values keyed for documents, see
+    PARTICIPANT_FIELDS, so a document gets them with a single dict update.
+    """
+
+    __slots__ = ("name", "driver", "team", "nationality", "race_number", "ai_controlled", "player_fields", "car_fields")
+
+    def __init__(self, data):
+        self.name = data.name.decode("utf-8", errors="replace")
+        self.driver = DriverIDs.get(data.driverId)
+        self.team = TeamIDs.get(data.teamId)
+        self.nationality = NationalityIDs.get(data.nationality)
+        self.race_number = data.raceNumber
+        self.ai_controlled = bool(data.aiControlled)
+        values = [getattr(self, field) for field in PARTICIPANT_FIELDS]
+        self.player_fields = dict(zip(PLAYER_KEYS, values))
+        self.car_fields = dict(zip(CAR_KEYS, values))
+
+
+class SessionState:
+    """Everything known about one session, keyed by sessionUID in SessionCache."""
+
+    def __init__(self, session_uid, format_timestamp=None):
+        self.session_uid = session_uid
+        self.format_timestamp = format_timestamp or IsoTimestamp()
+        self.epoch = None
+        self.started = None
+        self.track = None
+        self.session_type = None
+        self.weather = None
+        self.formula = None
+        self.total_laps = None
+        self.track_length = None
+        self.num_active_cars = 22
+        self.participants = [None] * 22
+        self._car_columns = {}
+        self.lap_status = {name: [None] * 22 for name, _ in LAP_STATUS_FIELDS}
+
+    def anchor(self, session_time, wall_time):
+        """Tie the session clock to the wall clock, unless already done.
+
+        Also sets `started`, the wall-clock start of the session in ISO format.
+        """
+        if self.epoch is None:
+            self.epoch = wall_time - session_time
+            self.started = IsoTimestamp()(self.epoch)
+
+    def timestamp(self, session_time):
+        """Return the @timestamp of a packet of this session, which must have been anchored."""
+        return self.format_timestamp(self.epoch + session_time)
+
+    def update_session(self, packet):
+        """Update from a PacketSessionData_V1."""
+        self.track = TrackIDs.get(packet.trackId, "unknown")
+        self.session_type = SessionsType.get(packet.sessionType, "unknown")
+        self.weather = Weather.get(packet.weather, "unknown")
+        self.formula = Formula.get(packet.formula, "unknown")
+        self.total_laps = packet.totalLaps
+        self.track_length = packet.trackLength
+
+    def update_participants(self, packet):
+        """Update from a PacketParticipantsData_V1."""
+        self.num_active_cars = packet.numActiveCars
+        self.participants = [Participant(data) for data in packet.participants]
+        self._car_columns = {}
+
+    def update_lap_data(self, data):
+        """Update the lap status of every car from a raw lap data packet."""
+        cars = np.frombuffer(data, dtype=LAP_DTYPE, count=1)[0]["lapData"]
+        for name, field in LAP_STATUS_FIELDS:
+            self.lap_status[name] = cars[field].tolist()
+
+    def car_name(self, index):
+        """Return the participant name of a car, or None before the participants packet."""
+        participant = self.participants[index]
+        return participant.name if participant is not None else None
+
+    def car_names(self, count):
+        return [participant.name if participant is not None else None for participant in self.participants[:count]]
+
+    def player_fields(self, index):
+        """Return the participant fields of the player car, keyed player_<attribute>."""
+        participant = self.participants[index]
+        return participant.player_fields if participant is not None else UNKNOWN_PLAYER
+
+    def car_fields(self, index):
+        """Return the participant fields of a car, keyed car_<attribute>."""
+        participant = self.participants[index]
+        return participant.car_fields if participant is not None else UNKNOWN_CAR
+
+    def car_columns(self, count):
+        """Return the participant fields of the first `count` cars as lists, keyed car_<attribute>.
+
+        The lists are shared by every document built until the next participants packet: do not
+        modify them.
+        """
+        columns = self._car_columns.get(count)
+        if columns is None:
+            fields = [self.car_fields(index) for index in range(min(count, len(self.participants)))]
+            columns = self._car_columns[count] = {key: [car[key] for car in fields] for key in CAR_KEYS}
+        return columns
+
+
+class SessionCache:
+    """SessionState by sessionUID, forgetting the least recently created session when full.
+
+    Args:
+        max_sessions: sessions kept at once.
+        timestamp_format: format of the @timestamp field, a key of TIMESTAMP_FORMATS.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, timestamp_format="iso"):
+        if timestamp_format not in TIMESTAMP_FORMATS:
+            raise ValueError(f"Bad timestamp format {timestamp_format!r}")
+        self.max_sessions = max_sessions
+        self.timestamp_formatter = TIMESTAMP_FORMATS[timestamp_format]
+        self._sessions = {}
+
+    def get(self, session_uid):
+        session = self._sessions.get(session_uid)
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                del self._sessions[next(iter(self._sessions))]
+            session = self._sessions[session_uid] = SessionState(session_uid, self.timestamp_formatter())
+        return session
+
+    def __len__(self):
+        return len(self._sessions)
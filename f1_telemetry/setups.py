@@ -0,0 +1,146 @@
+"""
+Car setups (5): one document per car and setup rather than per packet
+
+Setup packets arrive twice a second for every car, but a setup rarely changes within a session.
+SetupTracker compares the raw CarSetupData_V1 bytes of every car with the last ones seen in
+the session and writes a setup document only for the cars whose bytes changed. An unchanged
+packet costs one comparison of the whole setup array; otherwise the changed cars are found
+with a row comparison on a NumPy byte view of the packet, with no per-car object.
+
+Each setup document carries `setup_hash`, a hash of the setup bytes, so identical setups can be
+found across cars and sessions.
+"""
+import ctypes
+import hashlib
+
+import numpy as np
+
+from indices import SETUP_INDEX
+from model.dtypes import dtype_for
+from model.extractors import columns
+from model.f1_2020_struct import CarSetupData_V1, PacketCarSetupData_V1
+
+SETUP_DTYPE = dtype_for(PacketCarSetupData_V1)
+SETUP_OFFSET = PacketCarSetupData_V1.carSetups.offset
+SETUP_SIZE = ctypes.sizeof(CarSetupData_V1)
+
+CARS = 22
+
+SETUPS = slice(SETUP_OFFSET, SETUP_OFFSET + CARS * SETUP_SIZE)
+
+# Fields of the setup documents: (document key, field path), see model.extractors
+SETUP_MAPPING = [
+    ("front_wing", "carSetups[].frontWing"),
+    ("rear_wing", "carSetups[].rearWing"),
+    ("on_throttle", "carSetups[].onThrottle"),
+    ("off_throttle", "carSetups[].offThrottle"),
+    ("front_camber", "carSetups[].frontCamber"),
+    ("rear_camber", "carSetups[].rearCamber"),
+    ("front_toe", "carSetups[].frontToe"),
+    ("rear_toe", "carSetups[].rearToe"),
+    ("front_suspension", "carSetups[].frontSuspension"),
+    ("rear_suspension", "carSetups[].rearSuspension"),
+    ("front_anti_roll_bar", "carSetups[].frontAntiRollBar"),
+    ("rear_anti_roll_bar", "carSetups[].rearAntiRollBar"),
+    ("front_suspension_height", "carSetups[].frontSuspensionHeight"),
+    ("rear_suspension_height", "carSetups[].rearSuspensionHeight"),
+    ("brake_pressure", "carSetups[].brakePressure"),
+    ("brake_bias", "carSetups[].brakeBias"),
+    ("RL_tyre_pressure", "carSetups[].rearLeftTyrePressure"),
+    ("RR_tyre_pressure", "carSetups[].rearRightTyrePressure"),
+    ("FL_tyre_pressure", "carSetups[].frontLeftTyrePressure"),
+    ("FR_tyre_pressure", "carSetups[].frontRightTyrePressure"),
+    ("ballast", "carSetups[].ballast"),
+    ("fuel_load", "carSetups[].fuelLoad"),
+]
+
+SETUP_COLUMNS = columns(SETUP_MAPPING)
+
+# Sessions kept at once; more than one when several rigs share an ingester process
+MAX_SESSIONS = 16
+
+
+def setup_hash(setup):
+    """Return the hex digest identifying the raw bytes of one CarSetupData_V1."""
+    return hashlib.blake2b(setup, digest_size=8).hexdigest()
+
+
+class SessionSetups:
+    """Last setup bytes and hash of every car in one session."""
+
+    def __init__(self):
+        self.last = None
+        self.raw = None
+        self.hashes = {}
+
+
+class SetupTracker:
+    """Write a car's setup document when its setup bytes change within the session.
+
+    Args:
+        sink: where documents are written.
+        session_states: the SessionCache providing participant names, timestamps and the number
+            of cars.
+    """
+
+    def __init__(self, sink, session_states):
+        self.sink = sink
+        self.session_states = session_states
+        self.sessions = {}
+
+    def setup_hash(self, session_uid, car):
+        """Return the hash of the last setup written for a car, or None."""
+        session = self.sessions.get(session_uid)
+        return session.hashes.get(car) if session is not None else None
+
+    def add(self, header, data):
+        session = self._session(header.sessionUID)
+        # Usual case first: no setup changed, one comparison of the whole array
+        if session.raw is not None and data[SETUPS] == session.raw:
+            return
+        session.raw = bytes(data[SETUPS])
+        state = self.session_states.get(header.sessionUID)
+        count = state.num_active_cars
+        setups = np.frombuffer(data, dtype=np.uint8, count=CARS * SETUP_SIZE, offset=SETUP_OFFSET)
+        setups = setups.reshape(CARS, SETUP_SIZE)[:count]
+
+        if session.last is None or len(session.last) != count:
+            changed = np.arange(count)
+            session.last = setups.copy()
+        else:
+            changed = np.nonzero((setups != session.last).any(axis=1))[0]
+            if not len(changed):
+                return
+            session.last[changed] = setups[changed]
+
+        written = changed.tolist()
+        cars = np.frombuffer(data, dtype=SETUP_DTYPE, count=1)[0]["carSetups"][written]
+        keys = [column[0] for column in SETUP_COLUMNS]
+        values = [
+            cars[field].tolist() if element is None else cars[field][:, element].tolist()
+            for _, field, element in SETUP_COLUMNS
+        ]
+        base = {
+            "session_ts": header.sessionTime,
+            "@timestamp": state.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+        }
+        for car, row in zip(written, zip(*values)):
+            session.hashes[car] = setup_hash(setups[car])
+            doc = base.copy()
+            doc["car_index"] = car
+            doc["car_name"] = state.car_name(car)
+            doc["setup_hash"] = session.hashes[car]
+            doc.update(zip(keys, row))
+            self.sink.add(SETUP_INDEX, doc)
+
+    def _session(self, session_uid):
+        session = self.sessions.get(session_uid)
+        if session is None:
+            if len(self.sessions) >= MAX_SESSIONS:
+                del self.sessions[next(iter(self.sessions))]
+            session = self.sessions[session_uid] = SessionSetups()
+        return session
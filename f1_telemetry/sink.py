@@ -0,0 +1,280 @@
+"""
+Buffered Elasticsearch sink writing documents through the _bulk API
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, TransportError
+
+from serializer import NdjsonSerializer
+
+# Per-item (or per-request) statuses worth sending again: the cluster is overloaded or briefly unavailable.
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class BulkSink:
+    """Buffer documents and write them to Elasticsearch in batches.
+
+    A batch is sent when it holds `batch_size` documents or when its oldest document has waited
+    `flush_interval` seconds, whichever comes first. At most `max_in_flight` bulk requests run at
+    the same time; `add` blocks once that limit is reached, which pushes back on the producer.
+
+    Items rejected with a retryable status, and requests that could not reach the cluster, are
+    re-sent up to `max_retries` times with exponential backoff. Requests that timed out are not:
+    the cluster may have applied them, and documents have no ids to make a second send harmless.
+    The `flushed`, `retried` and `failed` counters count documents, not requests.
+
+    Request bodies are built by `serializer` (NdjsonSerializer by default), see serializer.py.
+
+    Time-critical documents such as race events go through `add_priority` instead: they skip the
+    batch and are sent by a separate thread within `priority_flush_interval` seconds, without
+    waiting for an in-flight slot.
+
+    Requests are spread round-robin over `hosts`, each with its own pool of kept-alive
+    connections (`connections_per_host`, by default enough for every concurrent request). A node
+    failing a request is left out for `dead_timeout` seconds, doubling on consecutive failures,
+    and the request is retried on another node. Every `health_interval` seconds the live nodes
+    are also probed, and those not answering are left out before a bulk request hits them. With
+    `sniff` set, the node list is refreshed from the cluster at startup, on failures and every
+    `sniff_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        hosts="http://es01:9200",
+        batch_size=500,
+        flush_interval=1.0,
+        max_in_flight=2,
+        compress=False,
+        max_retries=3,
+        retry_backoff=0.5,
+        request_timeout=30,
+        serializer=None,
+        priority_flush_interval=0.05,
+        sniff=False,
+        sniff_interval=60,
+        connections_per_host=None,
+        dead_timeout=60,
+        health_interval=10,
+        health_timeout=2,
+    ):
+        self.es = Elasticsearch(
+            hosts,
+            http_compress=compress,
+            # bulk workers, the priority lane and the health check
+            maxsize=connections_per_host or max_in_flight + 2,
+            dead_timeout=dead_timeout,
+            sniff_on_start=sniff,
+            sniff_on_connection_fail=sniff,
+            sniffer_timeout=sniff_interval if sniff else None,
+        )
+        self.serializer = serializer or NdjsonSerializer()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.request_timeout = request_timeout
+        self.priority_flush_interval = priority_flush_interval
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+
+        self.flushed = 0
+        self.retried = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffer_started = 0.0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="bulk")
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="bulk-timer", daemon=True)
+        self._timer.start()
+        self._priority = []
+        self._priority_ready = threading.Event()
+        self._priority_sender = threading.Thread(target=self._flush_priority, name="bulk-priority", daemon=True)
+        self._priority_sender.start()
+        self._health_checker = None
+        # Sniffing can add nodes to a single seed host later: they are probed from the start
+        if health_interval and (sniff or len(self.es.transport.hosts) > 1):
+            self._health_checker = threading.Thread(target=self._check_nodes, name="bulk-health", daemon=True)
+            self._health_checker.start()
+
+    def add(self, index, doc):
+        """Queue a document for `index`, sending the current batch if it is full."""
+        with self._lock:
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.append((index, doc))
+            if len(self._buffer) < self.batch_size:
+                return
+            batch = self._take()
+        self._submit(batch)
+
+    def add_priority(self, index, doc):
+        """Queue a time-critical document for `index`, sent apart from the batch."""
+        with self._lock:
+            self._priority.append((index, doc))
+        self._priority_ready.set()
+
+    def flush(self):
+        """Send whatever is buffered, without waiting for the request to complete."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._submit(batch)
+
+    def close(self):
+        """Stop the flush timer, send the remaining documents and wait for all requests."""
+        self._closed.set()
+        self._timer.join()
+        self._priority_ready.set()
+        self._priority_sender.join()
+        if self._health_checker is not None:
+            self._health_checker.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        pool = self.es.transport.connection_pool
+        return {
+            "flushed": self.flushed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "buffered": len(self._buffer),
+            "priority_buffered": len(self._priority),
+            "nodes_live": len(pool.connections),
+            "nodes_dead": pool.dead.qsize() if hasattr(pool, "dead") else 0,
+        }
+
+    def _take(self):
+        batch = self._buffer
+        self._buffer = []
+        return batch
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._lock:
+                if not self._buffer or time.monotonic() - self._buffer_started < self.flush_interval:
+                    continue
+                batch = self._take()
+            self._submit(batch)
+
+    def _flush_priority(self):
+        while True:
+            self._priority_ready.wait()
+            # Give documents arriving together (e.g. a collision penalty for two cars) a moment
+            # to share a request
+            self._closed.wait(self.priority_flush_interval)
+            with self._lock:
+                batch = self._priority
+                self._priority = []
+                self._priority_ready.clear()
+            if batch:
+                self._send(batch)
+            if self._closed.is_set():
+                return
+
+    def _check_nodes(self):
+        while not self._closed.wait(self.health_interval):
+            pool = self.es.transport.connection_pool
+            for connection in list(pool.connections):
+                try:
+                    connection.perform_request("HEAD", "/", timeout=self.health_timeout)
+                except Exception as e:
+                    logging.warning("Leaving out unhealthy node %s: %s", connection.host, e)
+                    pool.mark_dead(connection)
+
+    def _submit(self, batch):
+        self._slots.acquire()
+        future = self._executor.submit(self._send, batch)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _send(self, batch):
+        try:
+            self._send_with_retries(batch)
+        except Exception:
+            logging.exception("Bulk request failed, dropping %d documents", len(batch))
+            with self._lock:
+                self.failed += len(batch)
+
+    def _send_with_retries(self, batch):
+        attempt = 0
+        while True:
+            retry, flushed, failed = self._send_once(batch)
+            with self._lock:
+                self.flushed += flushed
+                self.failed += failed
+            if not retry:
+                return
+
+            attempt += 1
+            if attempt > self.max_retries:
+                logging.warning("Giving up on %d documents after %d retries", len(retry), self.max_retries)
+                with self._lock:
+                    self.failed += len(retry)
+                return
+
+            with self._lock:
+                self.retried += len(retry)
+            time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            batch = retry
+
+    def _send_once(self, batch):
+        """Send one bulk request; return (documents to retry, flushed count, failed count)."""
+        try:
+            response = self.es.bulk(body=self.serializer.bulk_body(batch), request_timeout=self.request_timeout)
+        except ConnectionTimeout:
+            # The cluster may have indexed the batch anyway: sending it again could index every
+            # document twice, since their ids are generated by Elasticsearch
+            logging.warning("Bulk request timed out, dropping %d documents", len(batch))
+            return [], 0, len(batch)
+        except ConnectionError:
+            return batch, 0, 0
+        except TransportError as e:
+            if e.status_code in RETRYABLE_STATUS:
+                return batch, 0, 0
+            logging.error("Bulk request rejected: %s", e)
+            return [], 0, len(batch)
+
+        if not response["errors"]:
+            return [], len(batch), 0
+
+        retry = []
+        flushed = failed = 0
+        for entry, item in zip(batch, response["items"]):
+            # One key, the action: "create" with NdjsonSerializer
+            (result,) = item.values()
+            if result["status"] < 300:
+                flushed += 1
+            elif result["status"] in RETRYABLE_STATUS:
+                retry.append(entry)
+            else:
+                failed += 1
+                logging.debug("Document rejected: %s", result.get("error"))
+        return retry, flushed, failed
+
+
+class NullSink:
+    """Sink that only counts documents, for benchmarks and dry-run replays."""
+
+    def __init__(self):
+        self.flushed = 0
+
+    def add(self, index, doc):
+        self.flushed += 1
+
+    def add_priority(self, index, doc):
+        self.flushed += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"flushed": self.flushed}
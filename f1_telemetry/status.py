@@ -0,0 +1,226 @@
+"""
+Car status tracking: fuel, ERS, tyre wear and damage of every car
+
+Car status values change slowly, so instead of one document per packet and car, StatusTracker
+writes a car's status document only when one of its channels moved by more than its deadband
+since the car's last document, or when `interval` seconds of session time have passed without
+one. Change detection runs on all cars at once over the NumPy view of the packet.
+
+StatusTracker also follows tyre stints in memory: a stint starts when a car's tyre compound
+changes or its tyre age goes back (a pit stop), and its wear and fuel use are reported as
+per-lap rates in the status documents. A "rollup": "stint" summary is written when a stint
+ends.
+"""
+import numpy as np
+
+from indices import ROLLUP_INDEX, STATUS_INDEX
+from model.dtypes import dtype_for
+from model.extractors import columns
+from model.f1_2020_struct import PacketCarStatusData_V1
+
+STATUS_DTYPE = dtype_for(PacketCarStatusData_V1)
+
+CARS = 22
+
+# Fields of the status documents: (document key, field path), see model.extractors
+STATUS_MAPPING = [
+    ("fuel_mix", "carStatusData[].fuelMix"),
+    ("front_brake_bias", "carStatusData[].frontBrakeBias"),
+    ("pit_limiter", "carStatusData[].pitLimiterStatus"),
+    ("fuel_in_tank", "carStatusData[].fuelInTank"),
+    ("fuel_capacity", "carStatusData[].fuelCapacity"),
+    ("fuel_remaining_laps", "carStatusData[].fuelRemainingLaps"),
+    ("drs_allowed", "carStatusData[].drsAllowed"),
+    ("FL_tyre_wear", "carStatusData[].tyresWear[0]"),
+    ("FR_tyre_wear", "carStatusData[].tyresWear[1]"),
+    ("RL_tyre_wear", "carStatusData[].tyresWear[2]"),
+    ("RR_tyre_wear", "carStatusData[].tyresWear[3]"),
+    ("actual_tyre_compound", "carStatusData[].actualTyreCompound"),
+    ("visual_tyre_compound", "carStatusData[].visualTyreCompound"),
+    ("tyres_age_laps", "carStatusData[].tyresAgeLaps"),
+    ("FL_tyre_damage", "carStatusData[].tyresDamage[0]"),
+    ("FR_tyre_damage", "carStatusData[].tyresDamage[1]"),
+    ("RL_tyre_damage", "carStatusData[].tyresDamage[2]"),
+    ("RR_tyre_damage", "carStatusData[].tyresDamage[3]"),
+    ("front_left_wing_damage", "carStatusData[].frontLeftWingDamage"),
+    ("front_right_wing_damage", "carStatusData[].frontRightWingDamage"),
+    ("rear_wing_damage", "carStatusData[].rearWingDamage"),
+    ("drs_fault", "carStatusData[].drsFault"),
+    ("engine_damage", "carStatusData[].engineDamage"),
+    ("gearbox_damage", "carStatusData[].gearBoxDamage"),
+    ("fia_flags", "carStatusData[].vehicleFiaFlags"),
+    ("ers_store_energy", "carStatusData[].ersStoreEnergy"),
+    ("ers_deploy_mode", "carStatusData[].ersDeployMode"),
+    ("ers_harvested_mguk", "carStatusData[].ersHarvestedThisLapMGUK"),
+    ("ers_harvested_mguh", "carStatusData[].ersHarvestedThisLapMGUH"),
+    ("ers_deployed", "carStatusData[].ersDeployedThisLap"),
+]
+
+STATUS_COLUMNS = columns(STATUS_MAPPING)
+
+# Change that triggers a document, by document key; other channels trigger one on any change
+DEADBANDS = {
+    "fuel_in_tank": 0.5,
+    "fuel_remaining_laps": 0.2,
+    "ers_store_energy": 200000,
+    "ers_harvested_mguk": 200000,
+    "ers_harvested_mguh": 200000,
+    "ers_deployed": 200000,
+}
+
+WHEELS = ["FL", "FR", "RL", "RR"]
+
+# Sessions kept at once; more than one when several rigs share an ingester process
+MAX_SESSIONS = 16
+
+
+class SessionStatus:
+    """Last written status and current stint of every car in one session."""
+
+    def __init__(self):
+        self.last_values = None
+        self.last_time = np.full(CARS, -np.inf)
+        self.stint = np.zeros(CARS, dtype=np.int64)
+        self.compound = None
+        self.age = None
+        self.wear = None
+        self.fuel = None
+        self.stint_start_age = None
+        self.stint_start_wear = None
+        self.stint_start_fuel = None
+
+    def start_stints(self, cars, compound, age, wear, fuel):
+        """Start a new stint for the cars selected by the boolean mask `cars`."""
+        self.stint[cars] += 1
+        self.stint_start_age[cars] = age[cars]
+        self.stint_start_wear[cars] = wear[cars]
+        self.stint_start_fuel[cars] = fuel[cars]
+
+    def stint_counters(self, car):
+        """Return the degradation counters of the current stint of `car`."""
+        laps = int(self.age[car] - self.stint_start_age[car])
+        wear = (self.wear[car] - self.stint_start_wear[car]).tolist()
+        fuel_used = float(self.stint_start_fuel[car] - self.fuel[car])
+        counters = {"stint": int(self.stint[car]), "stint_laps": laps, "stint_fuel_used": round(fuel_used, 3)}
+        for wheel, value in zip(WHEELS, wear):
+            counters[f"{wheel}_stint_wear"] = value
+            counters[f"{wheel}_tyre_wear_rate"] = round(value / laps, 3) if laps > 0 else None
+        counters["fuel_per_lap"] = round(fuel_used / laps, 3) if laps > 0 else None
+        return counters
+
+
+class StatusTracker:
+    """Write car status documents on change and keep per-stint degradation counters.
+
+    Args:
+        sink: where documents are written.
+        session_states: the SessionCache providing participant names, timestamps, lap numbers
+            and the number of cars.
+        interval: longest time in seconds of session time between two documents of a car.
+    """
+
+    def __init__(self, sink, session_states, interval=5.0):
+        self.sink = sink
+        self.session_states = session_states
+        self.interval = interval
+        self.deadbands = np.array([DEADBANDS.get(key, 0) for key, _, _ in STATUS_COLUMNS], dtype=np.float64)[:, None]
+        self.sessions = {}
+
+    def stints(self, session_uid, car):
+        """Return the counters of the current stint of a car, or None if no status was seen."""
+        session = self.sessions.get(session_uid)
+        if session is None or session.compound is None:
+            return None
+        return session.stint_counters(car)
+
+    def add(self, header, data):
+        session = self._session(header.sessionUID)
+        state = self.session_states.get(header.sessionUID)
+        cars = np.frombuffer(data, dtype=STATUS_DTYPE, count=1)[0]["carStatusData"]
+        matrix = np.empty((len(STATUS_COLUMNS), CARS))
+        for row, (_, field, element) in enumerate(STATUS_COLUMNS):
+            matrix[row] = cars[field] if element is None else cars[field][:, element]
+
+        compound = cars["actualTyreCompound"].astype(np.int64)
+        age = cars["tyresAgeLaps"].astype(np.int64)
+        wear = cars["tyresWear"].astype(np.int64)
+        fuel = cars["fuelInTank"].astype(np.float64)
+
+        if session.compound is None:
+            session.stint_start_age = age.copy()
+            session.stint_start_wear = wear.copy()
+            session.stint_start_fuel = fuel.copy()
+            session.stint[:] = 1
+            new_stint = np.zeros(CARS, dtype=bool)
+        else:
+            new_stint = (compound != session.compound) | (age < session.age)
+            ended = np.nonzero(new_stint[: state.num_active_cars])[0]
+            for car in ended.tolist():
+                self._emit_stint(header, state, session, car)
+            session.start_stints(new_stint, compound, age, wear, fuel)
+        session.compound = compound
+        session.age = age
+        session.wear = wear
+        session.fuel = fuel
+
+        if session.last_values is None:
+            changed = np.ones(CARS, dtype=bool)
+        else:
+            changed = (np.abs(matrix - session.last_values) > self.deadbands).any(axis=0)
+        elapsed = header.sessionTime - session.last_time
+        changed |= new_stint | (elapsed >= self.interval) | (elapsed < 0)
+        changed[state.num_active_cars :] = False
+
+        written = np.nonzero(changed)[0].tolist()
+        if not written:
+            return
+        if session.last_values is None:
+            session.last_values = matrix
+        else:
+            session.last_values[:, written] = matrix[:, written]
+        session.last_time[written] = header.sessionTime
+
+        keys = [column[0] for column in STATUS_COLUMNS]
+        values = [
+            cars[field].tolist() if element is None else cars[field][:, element].tolist()
+            for _, field, element in STATUS_COLUMNS
+        ]
+        lap_nums = state.lap_status["current_lap_num"]
+        base = {
+            "session_ts": header.sessionTime,
+            "@timestamp": state.timestamp(header.sessionTime),
+            "packet_id": header.packetId,
+            "session_UUID": str(header.sessionUID),
+            "session_time": header.sessionTime,
+            "frame_id": header.frameIdentifier,
+        }
+        for car in written:
+            doc = base.copy()
+            doc["car_index"] = car
+            doc["car_name"] = state.car_name(car)
+            doc["current_lap_num"] = lap_nums[car]
+            doc.update(zip(keys, (column[car] for column in values)))
+            doc.update(session.stint_counters(car))
+            self.sink.add(STATUS_INDEX, doc)
+
+    def _emit_stint(self, header, state, session, car):
+        doc = {
+            "@timestamp": state.timestamp(header.sessionTime),
+            "session_ts": header.sessionTime,
+            "session_UUID": str(header.sessionUID),
+            "frame_id": header.frameIdentifier,
+            "rollup": "stint",
+            "car_index": car,
+            "car_name": state.car_name(car),
+            "actual_tyre_compound": int(session.compound[car]),
+        }
+        doc.update(session.stint_counters(car))
+        self.sink.add(ROLLUP_INDEX, doc)
+
+    def _session(self, session_uid):
+        session = self.sessions.get(session_uid)
+        if session is None:
+            if len(self.sessions) >= MAX_SESSIONS:
+                del self.sessions[next(iter(self.sessions))]
+            session = self.sessions[session_uid] = SessionStatus()
+        return session
@@ -0,0 +1,242 @@
+"""
+Index templates with explicit, compact mappings for every document type
+
+Dynamic mapping indexes every float as a float or double and every string as both text and
+keyword. The templates installed by `install_templates` map each field from the ctypes type it
+is read from instead: unsigned bytes as short, signed bytes as byte, and so on, floats with a
+known resolution as scaled_float, and strings as keyword only. Fields missing from the templates
+(summaries, fields added later) fall back to the same rules through dynamic templates.
+
+Every index of indices.py becomes a data stream with its own template, sharing the settings of
+the "f1-common" component template: best_compression for the stored _source, a longer refresh
+interval, and the "f1" lifecycle policy rolling backing indices over by size and age so that
+shards stay bounded as sessions accumulate.
+"""
+import logging
+
+from events import EVENT_MAPPINGS
+from indices import (
+    CLASSIFICATION_INDEX,
+    EVENT_INDEX,
+    FRAME_INDEX,
+    LAP_INDEX,
+    ROLLUP_INDEX,
+    SESSION_INDEX,
+    SETUP_INDEX,
+    STATUS_INDEX,
+    TELEMETRY_INDEX,
+)
+from model.extractors import resolve
+from model.f1_2020_struct import (
+    PacketCarSetupData_V1,
+    PacketCarStatusData_V1,
+    PacketCarTelemetryData_V1,
+    PacketEventData_V1,
+    PacketFinalClassificationData_V1,
+    PacketLapData_V1,
+    PacketSessionData_V1,
+)
+from processor import CLASSIFICATION_MAPPING, LAP_MAPPING, TELEMETRY_MAPPING
+from setups import SETUP_MAPPING
+from status import STATUS_MAPPING, WHEELS
+
+# Elasticsearch type by struct format (see model.extractors.STRUCT_FORMATS), the smallest holding
+# every value of the ctypes type
+FIELD_TYPES = {
+    "B": "short",
+    "b": "byte",
+    "H": "integer",
+    "h": "short",
+    "I": "long",
+    "i": "integer",
+    "Q": "unsigned_long",
+    "q": "long",
+    "f": "float",
+    "d": "double",
+}
+
+# scaled_float scaling factor of the float fields with a known resolution, by document key
+SCALING_FACTORS = {
+    "session_ts": 1000,
+    "session_time": 1000,
+    "last_lap_time": 1000,
+    "current_lap_time": 1000,
+    "best_lap_time": 1000,
+    "lap_time": 1000,
+    "total_race_time": 1000,
+    "lap_distance": 100,
+    "total_distance": 100,
+    "throttle": 1000,
+    "steering": 1000,
+    "brake": 1000,
+    "fuel_in_tank": 1000,
+    "fuel_capacity": 1000,
+    "fuel_remaining_laps": 100,
+    "fuel_load": 100,
+    "front_camber": 100,
+    "rear_camber": 100,
+    "front_toe": 100,
+    "rear_toe": 100,
+    "speed": 100,
+    **{f"{wheel}_tyre_pressure": 100 for wheel in WHEELS},
+}
+
+KEYWORD = {"type": "keyword"}
+
+# Fields shared by the documents of several types
+COMMON_FIELDS = {
+    "@timestamp": {"type": "date", "format": "strict_date_optional_time||epoch_millis"},
+    "session_ts": {"type": "scaled_float", "scaling_factor": 1000},
+    "session_time": {"type": "scaled_float", "scaling_factor": 1000},
+    "session_UUID": KEYWORD,
+    "frame_id": {"type": "long"},
+    "packet_id": {"type": "byte"},
+    "packet_ids": {"type": "byte"},
+    "player_index": {"type": "short"},
+    "player_name": KEYWORD,
+    "player_driver": KEYWORD,
+    "player_team": KEYWORD,
+    "player_nationality": KEYWORD,
+    "player_race_number": {"type": "short"},
+    "player_ai_controlled": {"type": "boolean"},
+    "car_index": {"type": "short"},
+    "car_name": KEYWORD,
+    "car_driver": KEYWORD,
+    "car_team": KEYWORD,
+    "car_nationality": KEYWORD,
+    "car_race_number": {"type": "short"},
+    "car_ai_controlled": {"type": "boolean"},
+    "current_lap_num": {"type": "short"},
+    "sector": {"type": "short"},
+    "rollup": KEYWORD,
+}
+
+SESSION_MAPPING = [
+    ("track_temp", "trackTemperature"),
+    ("air_temp", "airTemperature"),
+    ("total_laps", "totalLaps"),
+    ("track_length", "trackLength"),
+]
+
+# Fields written by StatusTracker besides STATUS_MAPPING
+STINT_FIELDS = {
+    "stint": {"type": "short"},
+    "stint_laps": {"type": "short"},
+    "stint_fuel_used": {"type": "scaled_float", "scaling_factor": 1000},
+    "fuel_per_lap": {"type": "scaled_float", "scaling_factor": 1000},
+    **{f"{wheel}_stint_wear": {"type": "short"} for wheel in WHEELS},
+    **{f"{wheel}_tyre_wear_rate": {"type": "scaled_float", "scaling_factor": 1000} for wheel in WHEELS},
+}
+
+# Unmapped fields: strings as keyword only, floating point numbers as float
+DYNAMIC_TEMPLATES = [
+    {"strings": {"match_mapping_type": "string", "mapping": KEYWORD}},
+    {"floats": {"match_mapping_type": "double", "mapping": {"type": "float"}}},
+]
+
+COMPONENT_TEMPLATE = "f1-common"
+LIFECYCLE_POLICY = "f1"
+
+LIFECYCLE = {
+    "policy": {
+        "phases": {
+            "hot": {"actions": {"rollover": {"max_size": "30gb", "max_age": "7d"}}},
+        }
+    }
+}
+
+
+def field_type(packet_type, key, path, convert=None):
+    """Return the mapping of a field read from `path` of `packet_type`, see model.extractors."""
+    if convert is not None:
+        # Converters turn ids into display names
+        return KEYWORD
+    _, fmt, _, is_string = resolve(packet_type, path)
+    if is_string:
+        return KEYWORD
+    if fmt in ("f", "d") and key in SCALING_FACTORS:
+        return {"type": "scaled_float", "scaling_factor": SCALING_FACTORS[key]}
+    return {"type": FIELD_TYPES[fmt]}
+
+
+def properties(packet_type, mapping):
+    """Return the mapping properties of the fields of a document mapping."""
+    return {entry[0]: field_type(packet_type, *entry) for entry in mapping}
+
+
+def index_properties():
+    """Return the mapping properties of every index, by index name."""
+    lap = properties(PacketLapData_V1, LAP_MAPPING)
+    lap["lap_uuid"] = KEYWORD
+    telemetry = properties(PacketCarTelemetryData_V1, TELEMETRY_MAPPING)
+    status = properties(PacketCarStatusData_V1, STATUS_MAPPING)
+    status.update(STINT_FIELDS)
+    session = properties(PacketSessionData_V1, SESSION_MAPPING)
+    session.update({"track": KEYWORD, "type": KEYWORD, "weather": KEYWORD, "car_type": KEYWORD, "name": KEYWORD})
+    setup = properties(PacketCarSetupData_V1, SETUP_MAPPING)
+    setup["setup_hash"] = KEYWORD
+    event = {"event": KEYWORD, "event_name": KEYWORD, "other_car_name": KEYWORD}
+    for mapping in EVENT_MAPPINGS.values():
+        event.update(properties(PacketEventData_V1, mapping))
+    return {
+        SESSION_INDEX: session,
+        LAP_INDEX: lap,
+        TELEMETRY_INDEX: telemetry,
+        STATUS_INDEX: status,
+        SETUP_INDEX: setup,
+        CLASSIFICATION_INDEX: properties(PacketFinalClassificationData_V1, CLASSIFICATION_MAPPING),
+        EVENT_INDEX: event,
+        FRAME_INDEX: {**lap, **telemetry, **status},
+        ROLLUP_INDEX: {"lap_num": {"type": "short"}, "lap_time": {"type": "scaled_float", "scaling_factor": 1000}},
+    }
+
+
+def component_template(shards=1, replicas=1, refresh_interval="5s"):
+    return {
+        "template": {
+            "settings": {
+                "index.number_of_shards": shards,
+                "index.number_of_replicas": replicas,
+                "index.refresh_interval": refresh_interval,
+                "index.codec": "best_compression",
+                "index.lifecycle.name": LIFECYCLE_POLICY,
+            },
+            "mappings": {
+                "dynamic_templates": DYNAMIC_TEMPLATES,
+                "date_detection": False,
+                "properties": COMMON_FIELDS,
+            },
+        }
+    }
+
+
+def index_templates():
+    """Return the index template of every index, by template name (the index name)."""
+    return {
+        index: {
+            "index_patterns": [index + "*"],
+            "data_stream": {},
+            "composed_of": [COMPONENT_TEMPLATE],
+            "priority": 200,
+            "template": {"mappings": {"properties": fields}},
+        }
+        for index, fields in index_properties().items()
+    }
+
+
+def install_templates(es, shards=1, replicas=1):
+    """Install the lifecycle policy, component template and index templates, replacing older versions.
+
+    Returns:
+        True if everything was installed; failures are logged, since documents can still be
+        indexed with dynamic mappings.
+    """
+    try:
+        es.ilm.put_lifecycle(policy=LIFECYCLE_POLICY, body=LIFECYCLE)
+        es.cluster.put_component_template(name=COMPONENT_TEMPLATE, body=component_template(shards, replicas))
+        for name, template in index_templates().items():
+            es.indices.put_index_template(name=name, body=template)
+    except Exception:
+        logging.exception("Failed to install index templates")
+        return False
+    return True
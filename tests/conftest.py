@@ -0,0 +1,33 @@
+import ctypes
+import os
+import random
+import sys
+
+import pytest
+
+# The modules import each other as top-level modules, as when run from f1_telemetry/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "f1_telemetry"))
+
+from model.f1_2020_struct import HeaderFieldsToPacketType, PacketHeader  # noqa: E402
+
+PACKET_TYPES = list(HeaderFieldsToPacketType.values())
+
+
+@pytest.fixture
+def random_packet():
+    """Return a function building a packet of random bytes with a header valid for its type."""
+    rng = random.Random(0)
+    keys = {packet_type: key for key, packet_type in HeaderFieldsToPacketType.items()}
+
+    def build(packet_type):
+        packet = bytearray(rng.getrandbits(8) for _ in range(ctypes.sizeof(packet_type)))
+        header = PacketHeader.from_buffer(packet)
+        header.packetFormat, header.packetVersion, header.packetId = keys[packet_type]
+        return bytes(packet)
+
+    return build
+
+
+def same(a, b):
+    """Compare two decoded values, NaN being equal to NaN."""
+    return a == b or (a != a and b != b)
@@ -0,0 +1,53 @@
+import ctypes
+
+import numpy as np
+import pytest
+from conftest import PACKET_TYPES, same
+
+from model.dtypes import HeaderFieldsToDtype, PacketHeaderDtype, decode_packets, dtype_for
+from model.f1_2020_struct import HeaderFieldsToPacketType, PacketHeader, unpack_udp_packet
+
+
+def assert_matches(value, record, path="packet"):
+    """Compare a decoded ctypes value with the matching NumPy value, field by field."""
+    if isinstance(value, (ctypes.Structure, ctypes.Union)):
+        for name, _ in value._fields_:
+            assert_matches(getattr(value, name), record[name], f"{path}.{name}")
+    elif isinstance(value, ctypes.Array):
+        for index, element in enumerate(value):
+            assert_matches(element, record[index], f"{path}[{index}]")
+    elif isinstance(value, bytes):
+        # ctypes cuts char arrays at the first NUL, NumPy only strips trailing NULs
+        assert record.split(b"\0", 1)[0] == value, path
+    else:
+        assert same(record.item(), value), path
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES, ids=lambda packet_type: packet_type.__name__)
+def test_dtype_layout(packet_type):
+    dtype = dtype_for(packet_type)
+    assert dtype.itemsize == ctypes.sizeof(packet_type)
+    assert dtype.fields["header"][0] == PacketHeaderDtype
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES, ids=lambda packet_type: packet_type.__name__)
+def test_decode_packets(packet_type, random_packet):
+    packets = [random_packet(packet_type) for _ in range(3)]
+    batch = decode_packets(b"".join(packets), packet_type)
+    assert batch.shape == (3,)
+    for packet, record in zip(packets, batch):
+        assert_matches(packet_type.from_buffer_copy(packet), record)
+        assert_matches(unpack_udp_packet(packet), record)
+        assert record.tobytes() == packet
+
+
+def test_dtype_by_header_fields():
+    for key, packet_type in HeaderFieldsToPacketType.items():
+        assert HeaderFieldsToDtype[key] == dtype_for(packet_type)
+
+
+def test_decode_packets_bad_size():
+    packet_type = PACKET_TYPES[0]
+    with pytest.raises(ValueError):
+        decode_packets(bytes(ctypes.sizeof(packet_type) + 1), packet_type)
+    assert decode_packets(b"", PacketHeader).shape == (0,)
@@ -0,0 +1,50 @@
+import ctypes
+
+import pytest
+from conftest import PACKET_TYPES, same
+
+from model.extractors import Extractor, FullMappings, ctypes_extract, resolve
+from model.f1_2020_struct import CarTelemetryData_V1, PacketCarTelemetryData_V1, PacketLapData_V1
+
+
+def assert_same_doc(doc, expected):
+    assert doc.keys() == expected.keys()
+    for key, value in expected.items():
+        assert same(doc[key], value), key
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES, ids=lambda packet_type: packet_type.__name__)
+def test_full_mapping(packet_type, random_packet):
+    mapping = FullMappings[packet_type]
+    extractor = Extractor(packet_type, mapping)
+    data = random_packet(packet_type)
+    packet = packet_type.from_buffer_copy(data)
+    for car in (0, 7, 21) if extractor.stride else (0,):
+        assert_same_doc(extractor(data, car), ctypes_extract(packet, mapping, car))
+
+
+def test_converters(random_packet):
+    mapping = [
+        ("lap", "lapData[].currentLapNum", lambda value: value + 1),
+        ("fifth_lap", "lapData[5].currentLapNum", str),
+    ]
+    data = random_packet(PacketLapData_V1)
+    packet = PacketLapData_V1.from_buffer_copy(data)
+    doc = Extractor(PacketLapData_V1, mapping)(data, 3)
+    assert doc == {"lap": packet.lapData[3].currentLapNum + 1, "fifth_lap": str(packet.lapData[5].currentLapNum)}
+    assert doc == ctypes_extract(packet, mapping, 3)
+
+
+def test_resolve():
+    offset, fmt, stride, is_string = resolve(PacketCarTelemetryData_V1, "carTelemetryData[].brakesTemperature[2]")
+    assert (fmt, stride, is_string) == ("H", ctypes.sizeof(CarTelemetryData_V1), False)
+    assert offset == PacketCarTelemetryData_V1.carTelemetryData.offset + CarTelemetryData_V1.brakesTemperature.offset + 2 * 2
+
+
+@pytest.mark.parametrize(
+    "path",
+    ["carTelemetryData[].missing", "carTelemetryData[].brakesTemperature", "header[0]", "carTelemetryData[].speed[1]"],
+)
+def test_resolve_errors(path):
+    with pytest.raises(ValueError):
+        resolve(PacketCarTelemetryData_V1, path)
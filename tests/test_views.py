@@ -0,0 +1,78 @@
+import ctypes
+
+import pytest
+from conftest import PACKET_TYPES, same
+
+from model.f1_2020_struct import PacketCarTelemetryData_V1, PacketHeader, UnpackError, unpack_udp_packet
+from model.views import ArrayView, StructView, read_header, view_packet
+
+
+def assert_matches(value, view, path="packet"):
+    """Compare a decoded ctypes value with the matching view value, field by field."""
+    if isinstance(value, (ctypes.Structure, ctypes.Union)):
+        if isinstance(value, PacketHeader):
+            assert tuple(view) == tuple(getattr(value, name) for name, _ in value._fields_), path
+            return
+        assert isinstance(view, StructView), path
+        for name, _ in value._fields_:
+            assert_matches(getattr(value, name), getattr(view, name), f"{path}.{name}")
+    elif isinstance(value, ctypes.Array):
+        if isinstance(view, ArrayView):
+            assert len(view) == len(value), path
+            for index, element in enumerate(value):
+                assert_matches(element, view[index], f"{path}[{index}]")
+        else:
+            assert isinstance(view, tuple) and len(view) == len(value), path
+            for index, element in enumerate(value):
+                assert same(view[index], element), f"{path}[{index}]"
+    else:
+        assert same(view, value), path
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES, ids=lambda packet_type: packet_type.__name__)
+def test_view_packet(packet_type, random_packet):
+    data = random_packet(packet_type)
+    view = view_packet(data)
+    assert view._ctype is packet_type
+    assert_matches(unpack_udp_packet(data), view)
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES, ids=lambda packet_type: packet_type.__name__)
+def test_read_header(packet_type, random_packet):
+    data = random_packet(packet_type)
+    header = PacketHeader.from_buffer_copy(data)
+    assert_matches(header, read_header(data))
+
+
+def test_array_view(random_packet):
+    data = random_packet(PacketCarTelemetryData_V1)
+    cars = view_packet(data).carTelemetryData
+    assert cars[-1] is cars[21]
+    assert [car.speed for car in cars[20:]] == [car.speed for car in list(cars)[20:]]
+
+
+def unpack_error(function, data):
+    with pytest.raises(UnpackError) as error:
+        function(data)
+    return str(error.value)
+
+
+@pytest.mark.parametrize("size", [0, ctypes.sizeof(PacketHeader) - 1])
+def test_view_packet_too_short(size):
+    data = bytes(size)
+    assert unpack_error(view_packet, data) == unpack_error(unpack_udp_packet, data)
+
+
+def test_view_packet_unknown_type(random_packet):
+    data = bytearray(random_packet(PacketCarTelemetryData_V1))
+    PacketHeader.from_buffer(data).packetId = 42
+    assert "no match for key fields" in unpack_error(view_packet, data)
+    assert unpack_error(view_packet, data) == unpack_error(unpack_udp_packet, data)
+
+
+@pytest.mark.parametrize("change", [-1, 1])
+def test_view_packet_bad_size(random_packet, change):
+    data = random_packet(PacketCarTelemetryData_V1)
+    data = data[:change] if change < 0 else data + bytes(change)
+    assert "bad size" in unpack_error(view_packet, data)
+    assert unpack_error(view_packet, data) == unpack_error(unpack_udp_packet, data)